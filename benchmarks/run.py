@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import warnings
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks import synthetic
+from src.data_quality import vn_boundaries, vn_population, store_locations
+from src.data_analysis.key_matcher import KeyMatcher
+from src.data_analysis.ward_lookup import WardLookup
+from src.visualization.views import CityViews
+
+"""
+Benchmarks of the pipeline stages on synthetic data at 1x/10x/100x the national size.
+    python benchmarks/run.py --scales 1 10              # print timings, compare with benchmarks/baseline.json
+    python benchmarks/run.py --scales 1 10 --save       # record them as the new baseline
+Exits with status 1 when a stage is slower than its baseline by more than --tolerance.
+"""
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+STORES_PER_WARD = 0.4
+
+def timed(func, repeat):
+    # Best of `repeat` runs, and the result of the last run
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def run_scale(scale, repeat):
+    units = synthetic.admin_units(scale)
+    pivot = synthetic.census_pivot(units)
+    gadm = synthetic.gadm_wards(units)
+    stores = synthetic.store_points(units, int(len(units) * STORES_PER_WARD))
+    timings, info = {}, {"wards": len(units), "stores": len(stores)}
+
+    timings["census_keys"], census = timed(lambda: vn_population.transform_admin_data(
+        pivot.copy(), cols=["city","district","ward","total","urban","rural"], cols_to_fix=["city","district","ward"]), repeat)
+    timings["gadm_keys"], boundary = timed(lambda: vn_boundaries.adminkeys_to_match(vn_boundaries.fix_admin_names(gadm.copy())), repeat)
+    timings["store_keys"], _ = timed(lambda: store_locations.adminkeys_to_match(stores.copy(), cols_to_fix=["city","district","ward"]), repeat)
+
+    def match():
+        matcher = KeyMatcher(boundary)
+        return matcher.match(census, "ward"), matcher.hits["ward"]
+    timings["set_wardID"], (ward_ids, hits) = timed(match, repeat)
+    info["ward_match_rate"] = round(float(ward_ids.notna().mean()), 4)
+    census["ward_id"] = ward_ids
+
+    timings["area_and_dissolves"], _ = timed(lambda: vn_boundaries.build_hierarchy(boundary.copy()), repeat)
+    timings["ward_lookup_build"], lookup = timed(lambda: WardLookup(boundary, census, None), repeat)
+    timings["locate_stores"], positions = timed(lambda: lookup.locate_many(stores["long"], stores["lat"]), repeat)
+    info["stores_located"] = round(float((positions >= 0).mean()), 4)
+
+    def views():
+        city_views = CityViews(boundary)
+        for city in city_views.cities:
+            city_views.filtered(city)
+            city_views.filtered(city, city_views.district_options[city][0])
+        return city_views
+    timings["city_views"], _ = timed(views, repeat)
+    return {"seconds": {name: round(seconds, 4) for name, seconds in timings.items()}, "info": info}
+
+def compare(results, baseline, tolerance):
+    # Stages slower than tolerance x their baseline
+    regressions = []
+    for scale, result in results.items():
+        for name, seconds in result["seconds"].items():
+            base = baseline.get("results", {}).get(scale, {}).get("seconds", {}).get(name)
+            if base:
+                ratio = seconds / base
+                flag = "REGRESSION" if ratio > tolerance else ""
+                print(f"{scale:>5}x {name:<20}{base:>9.3f}s -> {seconds:>9.3f}s  x{ratio:.2f} {flag}")
+                if flag:
+                    regressions.append((scale, name, ratio))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", type=int, nargs="+", default=[1])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true")
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    results = {}
+    for scale in args.scales:
+        results[str(scale)] = run_scale(scale, args.repeat)
+        print(f"{scale}x", json.dumps(results[str(scale)]))
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump({"machine": {"python": platform.python_version(), "platform": platform.platform(),
+                                   "cpus": os.cpu_count()},
+                       "results": results}, f, indent=2)
+        return 0
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    return 1 if compare(results, baseline, args.tolerance) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
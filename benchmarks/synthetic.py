@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+"""
+Synthetic Vietnamese administrative datasets, to benchmark the pipeline without the source files.
+Scale 1 is the national size (63 cities, ~700 districts, ~10.6k wards), scales 10 and 100 repeat it with
+more cities. Names are made of Vietnamese syllables with diacritics, written the way each source writes them:
+- census pivots: "Thành phố Hà Nội", "Quận Ba Đình", "Phường 12"
+- GADM: names without spaces, titles mostly removed ("HàNội", "BaĐình", "Phường12")
+- store files: abbreviated titles ("TP. Hà Nội", "Q. Ba Đình", "P. 12")
+Wards are cells of a regular grid over Vietnam, districts and cities are runs of neighbouring cells.
+"""
+
+SYLLABLES = ["An","Bình","Châu","Đông","Đức","Giang","Hà","Hải","Hòa","Hưng","Khánh","Lâm","Long","Lộc","Mỹ",
+             "Nam","Nghĩa","Ngọc","Nhơn","Phú","Phúc","Phước","Quảng","Sơn","Tân","Tây","Thạnh","Thành","Thịnh",
+             "Thủy","Tiến","Trà","Trung","Vĩnh","Xuân","Yên","Cẩm","Định","Lương","Điền"]
+CITY_TITLES = np.array(["Thành phố","Tỉnh"])
+DIST_TITLES = np.array(["Quận","Huyện","Thị xã","Thành phố"])
+WARD_TITLES = np.array(["Phường","Xã","Thị trấn"])
+ABBREVIATIONS = {"Thành phố":"TP.","Tỉnh":"T.","Quận":"Q.","Huyện":"H.","Thị xã":"TX.","Phường":"P.","Xã":"X.","Thị trấn":"TT."}
+NATIONAL = {"cities": 63, "districts_per_city": 11, "wards_per_district": 15}
+# Grid of ward cells, in degrees
+ORIGIN = (102.0, 8.5)
+CELL = 0.01
+COLUMNS = 800
+
+def unique_names(rng, sizes, syllables):
+    # For every group, `size` distinct names of `syllables` syllables
+    combos = np.array(np.meshgrid(*[SYLLABLES]*syllables)).reshape(syllables, -1).T
+    pool = np.array([" ".join(combo) for combo in combos])
+    return np.concatenate([pool[rng.choice(len(pool), size, replace=False)] for size in sizes])
+
+def group_position(groups):
+    # Position of every row in its group, groups being consecutive
+    starts = np.r_[0, np.flatnonzero(groups[1:] != groups[:-1]) + 1]
+    return np.arange(len(groups)) - np.repeat(starts, np.diff(np.r_[starts, len(groups)]))
+
+def admin_units(scale=1, seed=0):
+    # One row per ward: titles and names of the ward, its district and its city, with their ids
+    rng = np.random.default_rng(seed)
+    n_cities = NATIONAL["cities"] * scale
+    per_city = NATIONAL["districts_per_city"]
+    n_dists = n_cities * per_city
+    n_wards = rng.integers(NATIONAL["wards_per_district"] - 5, NATIONAL["wards_per_district"] + 6, n_dists)
+
+    city_names = unique_names(rng, [n_cities], 3)
+    city_titles = CITY_TITLES[rng.integers(0, 2, n_cities)]
+    dist_city = np.repeat(np.arange(n_cities), per_city)
+    dist_names = unique_names(rng, [per_city] * n_cities, 2)
+    dist_titles = DIST_TITLES[rng.choice(4, n_dists, p=[0.3, 0.55, 0.1, 0.05])]
+    # Some urban districts are numbered (Quận 1), and so are the wards of some urban districts (Phường 12)
+    numbered_dist = (dist_titles=="Quận") & (rng.random(n_dists) < 0.3)
+    dist_names = np.where(numbered_dist, (group_position(dist_city) + 1).astype(str), dist_names)
+    numbered_wards = (dist_titles=="Quận") & (rng.random(n_dists) < 0.3)
+
+    ward_dist = np.repeat(np.arange(n_dists), n_wards)
+    ward_names = unique_names(rng, n_wards, 2)
+    ward_names = np.where(numbered_wards[ward_dist], (group_position(ward_dist) + 1).astype(str), ward_names)
+    urban = np.isin(dist_titles[ward_dist], ["Quận","Thị xã","Thành phố"])
+    ward_titles = np.where(urban, "Phường", WARD_TITLES[rng.choice([1, 2], len(ward_dist), p=[0.9, 0.1])])
+    ward_city = dist_city[ward_dist]
+    return pd.DataFrame({"city_title": city_titles[ward_city], "city_name": city_names[ward_city],
+                         "district_title": dist_titles[ward_dist], "district_name": dist_names[ward_dist],
+                         "ward_title": ward_titles, "ward_name": ward_names,
+                         "dist_id": [f"VNM.{c+1}.{d+1}_1" for c, d in zip(ward_city, group_position(dist_city)[ward_dist])],
+                         "ward_id": [f"VNM.{c+1}.{d+1}.{w+1}_1" for c, d, w in zip(ward_city, group_position(dist_city)[ward_dist],
+                                                                                  group_position(ward_dist))]})
+
+def parts(units, level):
+    # (titles, names) of a level ("city", "district" or "ward") as string arrays
+    return units[f"{level}_title"].to_numpy(dtype=str), units[f"{level}_name"].to_numpy(dtype=str)
+
+def full_name(title, name):
+    return np.char.add(np.char.add(title, " "), name)
+
+def census_pivot(units, seed=0):
+    # Population by ward as in the census workbook: city/district/ward with titles, total/urban/rural
+    rng = np.random.default_rng(seed)
+    total = rng.integers(1000, 40000, len(units))
+    urban = np.where(units["ward_title"]=="Phường", total, (total * rng.random(len(units))).astype(int))
+    return pd.DataFrame({"city": full_name(*parts(units, "city")),
+                         "district": full_name(*parts(units, "district")),
+                         "ward": full_name(*parts(units, "ward")),
+                         "total": total, "urban": urban, "rural": total - urban})
+
+def ward_cells(n):
+    # Square cell of every ward, consecutive wards (same district/city) are neighbours
+    col, row = np.arange(n) % COLUMNS, np.arange(n) // COLUMNS
+    x0, y0 = ORIGIN[0] + col * CELL, ORIGIN[1] + row * CELL
+    return shapely.box(x0, y0, x0 + CELL, y0 + CELL)
+
+def gadm_wards(units, seed=0):
+    # Ward boundaries as read from GADM: names without spaces, titles kept for numbered names only
+    rng = np.random.default_rng(seed)
+    def gadm_name(title, name):
+        keep = np.char.isnumeric(name) | (rng.random(len(name)) < 0.05)
+        return np.where(keep, np.char.add(np.char.replace(title, " ", ""), np.char.replace(name, " ", "")),
+                        np.char.replace(name, " ", ""))
+    return gpd.GeoDataFrame({"country": "Vietnam",
+                             "city": gadm_name(*parts(units, "city")),
+                             "district": gadm_name(*parts(units, "district")),
+                             "dist_id": units["dist_id"].values,
+                             "ward": gadm_name(*parts(units, "ward")),
+                             "ward_id": units["ward_id"].values},
+                            geometry=ward_cells(len(units)), crs=4326)
+
+def store_points(units, n, seed=0):
+    # Stores at random points of random wards, with abbreviated titles as in the store files
+    rng = np.random.default_rng(seed)
+    wards = rng.integers(0, len(units), n)
+    picked = units.iloc[wards]
+    def abbreviated(units, level):
+        title, name = parts(units, level)
+        return full_name(np.vectorize(ABBREVIATIONS.get)(title), name)
+    bounds = shapely.bounds(ward_cells(len(units))[wards])
+    return pd.DataFrame({"STORE_ID": np.arange(n),
+                         "city": abbreviated(picked, "city"),
+                         "district": abbreviated(picked, "district"),
+                         "ward": abbreviated(picked, "ward"),
+                         "long": rng.uniform(bounds[:,0], bounds[:,2]),
+                         "lat": rng.uniform(bounds[:,1], bounds[:,3])})
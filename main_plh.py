@@ -1,5 +1,38 @@
-from src.data_quality.vn_boundaries import exec_dist
-from src.data_quality.vn_population import exec_youngpop
+import sys
+from src.utils.pipeline import Pipeline
+from src.data_quality import vn_boundaries, vn_population, store_locations, ward_crosswalk
+from src.data_analysis import density, cube
 
-dist_boundaries = exec_dist()
-youngpop_dist = exec_youngpop()
+"""
+Full refresh of the datasets: boundaries, census workbooks, store files and crosswalk are independent and
+run in parallel, the demographic tables follow as soon as their inputs are ready.
+"""
+
+def refresh_pipeline():
+    pipeline = Pipeline()
+    # Ward & district boundaries are built together, the district node reads them from the cache
+    pipeline.add("ward_boundaries", vn_boundaries.exec, admin_level="ward")
+    pipeline.add("dist_boundaries", vn_boundaries.exec, after=["ward_boundaries"], admin_level="district")
+    for population_size in ["all", "young", "household"]:
+        pipeline.add(f"population_{population_size}", vn_population.exec, population_size=population_size)
+    pipeline.add("bhx_admin", store_locations.bhx_admin)
+    # Both brands are built together as well
+    pipeline.add("stores_Winmart", store_locations.exec, after=["ward_boundaries","bhx_admin","ward_crosswalk"], brand="Winmart")
+    pipeline.add("stores_BHX", store_locations.exec, after=["stores_Winmart"], brand="BHX")
+    pipeline.add("ward_crosswalk", ward_crosswalk.exec)
+    pipeline.add("demographic_ward", density.demographic_ward,
+                 inputs={"df_allpop":"population_all", "df_householdpop":"population_household", "ward_boundaries":"ward_boundaries"})
+    pipeline.add("demographic_dist", density.demographic_dist,
+                 inputs={"df_youngpop":"population_young", "dist_boundaries":"dist_boundaries"})
+    # Only the store counts of the wards whose stores changed are refreshed, unless the census changed
+    pipeline.add("cube", cube.refresh,
+                 inputs={"ward_boundaries":"ward_boundaries", "dist_boundaries":"dist_boundaries",
+                         "df_demographic_ward":"demographic_ward", "df_demographic_dist":"demographic_dist",
+                         "stores_Winmart":"stores_Winmart", "stores_BHX":"stores_BHX"})
+    return pipeline
+
+if __name__ == "__main__":
+    # python main_plh.py [workers]
+    pipeline = refresh_pipeline()
+    results = pipeline.run(workers=int(sys.argv[1]) if len(sys.argv) > 1 else None)
+    print(pipeline.report())
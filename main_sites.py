@@ -0,0 +1,26 @@
+import argparse
+from src.data_analysis import sites
+
+"""
+Enrich a file of candidate sites with the figures of their ward (population, households, young population,
+store counts by brand), chunk by chunk:
+    python main_sites.py candidates.csv enriched.parquet --lat lat --lon long --workers 4
+"""
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", help="CSV or Parquet file of sites")
+    parser.add_argument("output", help="CSV or Parquet file to write, from its extension")
+    parser.add_argument("--lat", default="lat")
+    parser.add_argument("--lon", default="long")
+    parser.add_argument("--chunk-size", type=int, default=sites.CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=1, help="processes enriching the chunks, 0 for all cores")
+    args = parser.parse_args()
+
+    boundary, table = sites.load_ward_table()
+    rows = sites.enrich_file(args.input, args.output, boundary, table, lat_col=args.lat, lon_col=args.lon,
+                             chunk_size=args.chunk_size, workers=args.workers)
+    print(f"{rows} sites written to {args.output}")
+
+if __name__ == "__main__":
+    main()
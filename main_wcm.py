@@ -1,4 +1,5 @@
 from src.data_analysis.density import exec as demographic
+from src.utils import excel_mirror
 import pandas as pd
 import folium
 from folium.plugins import MarkerCluster
@@ -6,8 +7,6 @@ import streamlit as st
 from streamlit_folium import st_folium
 from shapely.geometry import Point
 
-@st.cache_data
-
 # def load_data():
 #     df_store = pd.read_excel(r"data\Winmart location.xlsx")
 #     # Get population enhanced data
@@ -23,8 +22,13 @@ from shapely.geometry import Point
 # df_householdpop_with_id = demographic(df_householdpop, ward_boundaries, "ward")
 # df_demographic_ward = pd.merge(df_allpop_with_id, df_householdpop_with_id, how="inner", on=["ward_id","city","district_org","ward_org","district","ward"])
 
+# Heavy datasets are loaded once for all sessions, not on every widget interaction
+@st.cache_resource
 def load_data():
-    df_store = pd.read_excel(r"data\Winmart location.xlsx")
-test = demographic("ward")
+    df_store = excel_mirror.read_excel(r"data\Winmart location.xlsx")
+    df_demographic_ward = demographic("ward")
+    return df_store, df_demographic_ward
+
+df_store, test = load_data()
 
 st.write(test)
\ No newline at end of file
@@ -1,32 +1,55 @@
+import os
+import sys
 import pandas as pd
 import geopandas as gpd
 import folium
-from folium.plugins import MarkerCluster
 import streamlit as st
 from streamlit_folium import st_folium
-from shapely.geometry import Point
+# streamlit run only puts other/ on the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.utils import excel_mirror
+from src.utils.compact import IdLookup, compact
+from src.data_analysis.ward_lookup import WardLookup
+from src.visualization.geometry_pyramid import get_layer, resolution_for_zoom
+from src.visualization.views import CityViews
+from src.visualization.markers import StoreMarkers
 
 st.set_page_config(layout="wide")
 
+# Heavy datasets are loaded once for all sessions
+@st.cache_resource
 def load_data():
     wcm_path = r'C:\Users\Admin\Desktop\Map_visualization_ver2\wcm_stores_with_info.xlsx'
-    df_stores = pd.read_excel(wcm_path)
+    df_stores = excel_mirror.read_excel(wcm_path)
 
     population_path = r'C:\Users\Admin\Desktop\Map_visualization_ver2\population_withid.xlsx'
-    df_population = pd.read_excel(population_path)
+    df_population = excel_mirror.read_excel(population_path)
 
     geojson_file = r'C:\Users\Admin\Desktop\Map_visualization_ver2\Boundary.geojson'
     boundary = gpd.read_file(geojson_file)
 
-    return df_stores, df_population, boundary
+    # Compact layout shared by the sessions: ward_id as keys of the boundary IDs, names as categoricals
+    lookups = {"ward_id": IdLookup.from_boundary(boundary, "ward_id")}
+    return compact(df_stores, lookups), compact(df_population, lookups), compact(boundary, lookups)
 
 def create_map(location):
     return folium.Map(location=location, zoom_start=12)
 
-def add_choropleth(m, boundary, df_population, selected_city):
-    filtered_boundary = boundary[boundary['city'] == selected_city]
+@st.cache_resource
+def load_views(_boundary):
+    # Per-city options and filtered wards, indexed once
+    return CityViews(_boundary)
+
+# Map layers of the most recently viewed cities
+@st.cache_data(max_entries=32)
+def load_layer(_boundary, selected_city, resolution):
+    return get_layer(_boundary, selected_city, "ward", resolution)
+
+def add_choropleth(m, boundary, df_population, selected_city, zoom):
+    # Simplified ward shapes matching the zoom level, instead of the full precision polygons
+    geo_data = load_layer(boundary, selected_city, resolution_for_zoom(zoom))
     folium.Choropleth(
-        geo_data=filtered_boundary,
+        geo_data=geo_data,
         data=df_population,
         columns=['ward_id', 'total'],
         key_on='feature.properties.ward_id',
@@ -37,26 +60,22 @@ def add_choropleth(m, boundary, df_population, selected_city):
         highlight=True
     ).add_to(m)
 
-def add_markers(m, df_stores, filtered_boundary):
-    marker_cluster = MarkerCluster().add_to(m)
-    for _, store in df_stores.iterrows():
-        point = Point(store['long'], store['lat'])
-        if filtered_boundary['geometry'].contains(point).any():
-            folium.Marker(location=[store['lat'], store['long']], popup=store['STORE_NAME']).add_to(marker_cluster)
-
-def zoom_to_location(m, boundary, selected_city):
-    filtered_boundary = boundary[boundary['city'] == selected_city]
+@st.cache_resource
+def load_markers(_df_stores, _views, _ward_lookup):
+    # Stores located in their ward once, marker payloads cached per selection
+    return StoreMarkers(_df_stores, _views, lookup=_ward_lookup)
 
-    if not filtered_boundary.empty:
-        filtered_boundary = filtered_boundary.to_crs(epsg=4326)  
-
-        center_lat = filtered_boundary.geometry.centroid.y.mean()
-        center_long = filtered_boundary.geometry.centroid.x.mean()
-        m.location = [center_lat, center_long]
+def zoom_to_location(m, views, selected_city):
+    if selected_city in views.centers:
+        m.location = views.centers[selected_city]
         m.zoom_start = 13 
 
-def display_store_data_and_population_info(df_population, df_stores, boundary, lat, lon):
-    point = Point(lon, lat)
+@st.cache_resource
+def load_ward_lookup(_boundary, _df_population, _df_stores):
+    # Spatial index & ward_id indexes, built once for the whole app
+    return WardLookup(_boundary, _df_population, _df_stores)
+
+def display_store_data_and_population_info(ward_lookup, lat, lon):
     found = False
     population = 0
     store_count = 0
@@ -64,49 +83,49 @@ def display_store_data_and_population_info(df_population, df_stores, boundary, l
     ward_name = ""
     district_name = ""
 
-    for _, feature in boundary.iterrows():
-        if feature['geometry'].contains(point):
-            ward_id = feature['ward_id']
-            filtered_population = df_population[df_population['ward_id'] == ward_id]
-            population = filtered_population['total'].values[0] if not filtered_population.empty else 0
-            store_count = df_stores[df_stores['ward_id'] == ward_id].shape[0]
-            filtered_stores = df_stores[df_stores['ward_id'] == ward_id]
-            ward_name = feature['ward']
-            district_name = feature['district'] 
-            found = True
-            break
+    feature = ward_lookup.locate(lon, lat)
+    if feature is not None:
+        ward_id = feature['ward_id']
+        population = ward_lookup.population_of(ward_id, 'total')
+        filtered_stores = ward_lookup.stores_in(ward_id)
+        store_count = filtered_stores.shape[0]
+        ward_name = feature['ward']
+        district_name = feature['district']
+        found = True
 
     return found, filtered_stores, population, store_count, ward_name, district_name
 
 df_stores, df_population, boundary = load_data()
+ward_lookup = load_ward_lookup(boundary, df_population, df_stores)
+views = load_views(boundary)
+markers = load_markers(df_stores, views, ward_lookup)
 
-city_options = boundary['city'].unique()
+city_options = views.cities
 selected_city = st.sidebar.selectbox('City', city_options)
 
-district_options = boundary[boundary['city'] == selected_city]['district'].unique()
-selected_district = st.sidebar.selectbox('District', ['All'] + list(district_options))
+district_options = views.district_options[selected_city]
+selected_district = st.sidebar.selectbox('District', ['All'] + district_options)
 
-ward_options = boundary[boundary['city'] == selected_city]['ward'].unique()
-selected_ward = st.sidebar.selectbox('Ward', ['All'] + list(ward_options))
+ward_options = views.ward_options[selected_city]
+selected_ward = st.sidebar.selectbox('Ward', ['All'] + ward_options)
 
 concept_options = df_stores['concept'].unique()
 selected_concept = st.sidebar.selectbox('Chọn concept', ['All'] + list(concept_options))
 
-filtered_boundary = boundary[boundary['city'] == selected_city]
-if selected_district != 'All':
-    filtered_boundary = filtered_boundary[filtered_boundary['district'] == selected_district]
-if selected_ward != 'All':
-    filtered_boundary = filtered_boundary[filtered_boundary['ward'] == selected_ward]
 with st.container():
     col1, col2 = st.columns([3, 1])  
 
     with col1:
         m = create_map([10.762622, 106.660172])
-        add_choropleth(m, boundary, df_population, selected_city)
-        add_markers(m, df_stores, filtered_boundary)
-        zoom_to_location(m, boundary, selected_city)
+        add_choropleth(m, boundary, df_population, selected_city, st.session_state.get('zoom', 12))
+        markers.add_to(m, selected_city, selected_district, selected_ward, selected_concept)
+        folium.LayerControl().add_to(m)
+        zoom_to_location(m, views, selected_city)
 
         map_container = st_folium(m, width=700, height=400)  
+        # The next rerun renders the shapes at the current zoom
+        if map_container and map_container.get('zoom'):
+            st.session_state['zoom'] = map_container['zoom']
 
         
         found = False
@@ -122,7 +141,7 @@ with st.container():
                 lat = last_clicked['lat']
                 lon = last_clicked['lng']
 
-                found, filtered_stores, population, store_count, ward_name, district_name = display_store_data_and_population_info(df_population, df_stores, boundary, lat, lon)
+                found, filtered_stores, population, store_count, ward_name, district_name = display_store_data_and_population_info(ward_lookup, lat, lon)
 
                 if found:
                     st.markdown(f"**District:** {district_name}")
@@ -0,0 +1,195 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from src.utils import artifact_cache
+from src.utils.instrument import instrumented, annotate
+from src.data_analysis.scoring import HOUSEHOLD_COLS
+
+"""
+Materialized aggregate cube: one row per ward (ward_cube) and per district (dist_cube) with population,
+urban/rural, households by size, young population, area and store counts by brand and concept.
+- demographic figures only change with the boundaries and census workbooks: they are only recomputed when the
+  content hash of those sources changes
+- store counts are refreshed incrementally: the stores of the last refresh are kept as a snapshot, and when a
+  store file changes only the wards (and districts) whose stores were added, moved or removed are recounted
+The cube is written as Parquet under CUBE_DIR, and queried from DuckDB through views (see database.py).
+"""
+
+CUBE_DIR = os.path.join(artifact_cache.CACHE_DIR, "cube")
+CUBE_NAMES = ["ward_cube","dist_cube"]
+# Store id and concept columns of every brand
+STORE_KEYS = {"Winmart": {"id": "STORE_ID", "concept": "concept"},
+              "BHX": {"id": "storeId", "concept": "storeTypeId"}}
+WARD_COLS = ["ward_id","dist_id","city","district","ward"]
+DIST_COLS = ["dist_id","city","district"]
+
+def ward_figures(ward_boundaries, df_demographic_ward, df_demographic_dist):
+    """
+    One row per ward polygon (same order as ward_boundaries) with its demographic figures, missing if unknown.
+    - ward_boundaries: vn_boundaries.exec("ward"), with area_sqm
+    - df_demographic_ward/df_demographic_dist: density.exec("ward")/density.exec("district")
+    """
+    wards = pd.DataFrame(ward_boundaries[WARD_COLS + ["area_sqm"]]).reset_index(drop=True)
+    demographic = df_demographic_ward.dropna(subset=["ward_id"]).drop_duplicates("ward_id").set_index("ward_id")
+    demographic = demographic.reindex(wards["ward_id"].astype(object))
+    wards["population"] = demographic["total"].to_numpy(dtype=float)
+    wards["urban"] = demographic["urban"].to_numpy(dtype=float)
+    wards["rural"] = demographic["rural"].to_numpy(dtype=float)
+    for col in HOUSEHOLD_COLS:
+        wards[f"households_{col}"] = demographic[col].to_numpy(dtype=float)
+    wards["households"] = demographic[HOUSEHOLD_COLS].astype(float).sum(axis=1, min_count=1).to_numpy()
+    # Young population is only known by district: spread it over its wards pro rata of their population
+    young_dist = df_demographic_dist.dropna(subset=["dist_id"]).drop_duplicates("dist_id").set_index("dist_id")["15-34_total"]
+    dist_ids = wards["dist_id"].astype(object)
+    dist_total = wards.groupby(dist_ids)["population"].sum()
+    wards["dist_young"] = young_dist.astype(float).reindex(dist_ids).to_numpy()
+    wards["young"] = wards["population"] * (young_dist / dist_total).reindex(dist_ids).to_numpy(dtype=float)
+    return wards
+
+def district_figures(wards, dist_boundaries, df_demographic_dist):
+    """
+    One row per district with the ward figures summed up and its young population by urban/rural.
+    - wards: ward_figures of the district's wards
+    - dist_boundaries: vn_boundaries.exec("district"), with area_sqm
+    """
+    dists = pd.DataFrame(dist_boundaries[DIST_COLS + ["area_sqm"]]).dropna(subset=["dist_id"]).drop_duplicates("dist_id")
+    dists = dists.reset_index(drop=True)
+    measures = ["population","urban","rural"] + [f"households_{col}" for col in HOUSEHOLD_COLS] + ["households"]
+    totals = wards[measures].groupby(wards["dist_id"].astype(object)).sum(min_count=1)
+    totals = totals.reindex(dists["dist_id"].astype(object))
+    for col in measures:
+        dists[col] = totals[col].to_numpy(dtype=float)
+    young = df_demographic_dist.dropna(subset=["dist_id"]).drop_duplicates("dist_id").set_index("dist_id")
+    young = young[[col for col in young.columns if str(col).startswith("15-34_")]].astype(float)
+    young = young.reindex(dists["dist_id"].astype(object))
+    dists["young"] = young["15-34_total"].to_numpy()
+    for col in young.columns:
+        dists[col] = young[col].to_numpy()
+    return dists
+
+def demographics(ward_boundaries, dist_boundaries, df_demographic_ward, df_demographic_dist):
+    # Ward and district figures, without store counts
+    wards = ward_figures(ward_boundaries, df_demographic_ward, df_demographic_dist)
+    wards = wards.dropna(subset=["ward_id"]).drop_duplicates("ward_id").reset_index(drop=True)
+    return {"ward": wards, "district": district_figures(wards, dist_boundaries, df_demographic_dist)}
+
+def demographic_sources():
+    from src.data_quality import vn_boundaries, vn_population
+    from src.data_analysis import density, key_matcher
+    from src.utils import compact
+    inputs = vn_boundaries.SOURCES + [dataset["path"] for dataset in vn_population.WORKBOOKS.values()]
+    inputs += [vn_population.__file__, density.__file__, key_matcher.__file__, compact.__file__, __file__]
+    return sorted(set(inputs))
+
+def store_snapshot(stores):
+    # One row per store: brand, store_id, concept and its ward/district
+    snapshots = []
+    for brand, df in stores.items():
+        keys = STORE_KEYS[brand]
+        snapshots.append(pd.DataFrame({"brand": brand,
+                                       "store_id": df[keys["id"]].astype(str).to_numpy(),
+                                       "concept": df[keys["concept"]].astype(str).to_numpy(),
+                                       "ward_id": df["ward_id"].astype(object).to_numpy(),
+                                       "dist_id": df["dist_id"].astype(object).to_numpy()}))
+    snapshot = pd.concat(snapshots, ignore_index=True)
+    # Store ids are unique within a brand, keep the first row of duplicated ones
+    return snapshot.drop_duplicates(["brand","store_id"]).reset_index(drop=True)
+
+def changed_stores(old, new):
+    # Stores added, removed, moved to another ward or changing concept, with their old (_old) and new (_new) ward
+    merged = pd.merge(old, new, how="outer", on=["brand","store_id"], suffixes=("_old","_new"), indicator=True)
+    moved = merged["_merge"]!="both"
+    for col in ["ward_id","dist_id","concept"]:
+        moved |= ~(merged[f"{col}_old"].fillna("") == merged[f"{col}_new"].fillna(""))
+    return merged[moved]
+
+def store_counts(snapshot, key):
+    # Number of stores by brand and by brand & concept, per key (ward_id or dist_id)
+    snapshot = snapshot.dropna(subset=[key])
+    by_brand = pd.crosstab(snapshot[key], "stores_" + snapshot["brand"])
+    by_concept = pd.crosstab(snapshot[key], "stores_" + snapshot["brand"] + "_" + snapshot["concept"])
+    return pd.concat([by_brand, by_concept], axis=1).rename_axis(index=key, columns=None).astype(np.int32)
+
+def with_counts(figures, counts, key):
+    # Store count columns of the figures replaced by counts, 0 for keys without stores
+    figures = figures.drop(columns=[col for col in figures.columns if col.startswith("stores_")])
+    counts = counts.reindex(figures[key].astype(object), fill_value=0)
+    return pd.concat([figures.reset_index(drop=True), counts.reset_index(drop=True)], axis=1)
+
+def update_counts(cube, snapshot, key, keys):
+    # Recount the stores of the given keys only, new brand/concept columns start at 0 for the other keys,
+    # and brand/concept columns without any store left are dropped, as a full rebuild would not have them
+    counts = store_counts(snapshot[snapshot[key].isin(keys)], key)
+    cols = list(dict.fromkeys([col for col in cube.columns if col.startswith("stores_")] + list(counts.columns)))
+    cube = cube.reindex(columns=[col for col in cube.columns if not col.startswith("stores_")] + cols)
+    cube[cols] = cube[cols].fillna(0).astype(np.int32)
+    rows = cube[key].isin(keys).to_numpy()
+    cube.loc[rows, cols] = counts.reindex(index=cube.loc[rows, key].astype(object), columns=cols, fill_value=0).to_numpy(dtype=np.int32)
+    return cube.drop(columns=[col for col in cols if cube[col].sum()==0])
+
+def _paths(cube_dir):
+    return {name: os.path.join(cube_dir, f"{name}.parquet") for name in CUBE_NAMES + ["stores"]}
+
+def _load_state(cube_dir):
+    paths = _paths(cube_dir)
+    meta_path = os.path.join(cube_dir, "meta.json")
+    if not all(os.path.exists(path) for path in list(paths.values()) + [meta_path]):
+        return None, {}
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return {name: pd.read_parquet(path) for name, path in paths.items()}, meta
+
+def _save_state(cube_dir, state, meta):
+    os.makedirs(cube_dir, exist_ok=True)
+    # Write then rename, so that a concurrent reader never sees a partial file
+    for name, path in _paths(cube_dir).items():
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        state[name].to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    with open(os.path.join(cube_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+@instrumented()
+def refresh(ward_boundaries, dist_boundaries, df_demographic_ward, df_demographic_dist, stores_Winmart, stores_BHX,
+            cube_dir=CUBE_DIR, force=False):
+    """
+    Bring the cube up to date and return {"ward_cube", "dist_cube"}.
+    - ward_boundaries/dist_boundaries: vn_boundaries.exec("ward")/vn_boundaries.exec("district")
+    - df_demographic_ward/df_demographic_dist: density.exec("ward")/density.exec("district")
+    - stores_Winmart/stores_BHX: store_locations.exec("Winmart")/store_locations.exec("BHX")
+    Everything is rebuilt when the demographic sources change (or with force), otherwise only the store
+    counts of the wards and districts whose stores changed since the last refresh.
+    """
+    snapshot = store_snapshot({"Winmart": stores_Winmart, "BHX": stores_BHX})
+    demographic_key = artifact_cache.cache_key("cube_demographics", demographic_sources())
+    state, meta = _load_state(cube_dir)
+
+    if force or state is None or meta.get("demographic_key")!=demographic_key:
+        figures = demographics(ward_boundaries, dist_boundaries, df_demographic_ward, df_demographic_dist)
+        state = {"ward_cube": with_counts(figures["ward"], store_counts(snapshot, "ward_id"), "ward_id"),
+                 "dist_cube": with_counts(figures["district"], store_counts(snapshot, "dist_id"), "dist_id")}
+        annotate(refresh="full")
+    else:
+        changed = changed_stores(state["stores"], snapshot)
+        wards = set(pd.concat([changed["ward_id_old"], changed["ward_id_new"]]).dropna())
+        dists = set(pd.concat([changed["dist_id_old"], changed["dist_id_new"]]).dropna())
+        annotate(refresh="incremental", stores_changed=len(changed), wards_recounted=len(wards), dists_recounted=len(dists))
+        if changed.empty:
+            return {name: state[name] for name in CUBE_NAMES}
+        state["ward_cube"] = update_counts(state["ward_cube"], snapshot, "ward_id", wards)
+        state["dist_cube"] = update_counts(state["dist_cube"], snapshot, "dist_id", dists)
+    state["stores"] = snapshot
+    _save_state(cube_dir, state, {"demographic_key": demographic_key})
+    return {name: state[name] for name in CUBE_NAMES}
+
+def exec(cube_dir=CUBE_DIR, force=False):
+    # Refresh from the cached stages, outside of the pipeline
+    from src.data_quality.vn_boundaries import exec as boundaries
+    from src.data_quality.store_locations import exec as store_locations
+    from src.data_analysis.density import exec as demographic
+    return refresh(boundaries("ward"), boundaries("district"), demographic("ward"), demographic("district"),
+                   store_locations("Winmart"), store_locations("BHX"), cube_dir=cube_dir, force=force)
+
+def cube_paths(cube_dir=CUBE_DIR):
+    return {name: path for name, path in _paths(cube_dir).items() if name in CUBE_NAMES}
@@ -1,75 +1,87 @@
+import os
 import pandas as pd
 from src.data_quality.vn_boundaries import exec as boundaries
-from src.data_quality.vn_population import exec as population
-import duckdb
-
-query_init = f"""
-INSTALL spatial; 
-LOAD spatial;
-"""
-duckdb.default_connection.sql(query_init)
+from src.data_quality.vn_population import load as population
+from src.data_analysis.key_matcher import get_matcher
+from src.utils.instrument import instrumented, annotate, match_rate
+from src.utils.compact import IdLookup, compact, shared_categories
+from src.utils.artifact_cache import CACHE_DIR
 
 """
 To utilize all available data, I need to create a key id to map all datasets. I'm using GADM's IDs for this purpose.
 Please note that GADM doesn't have boundaries of Trường Sa(Khánh Hòa)-3 wards and Côn Đảo (BRVT)-1 ward
 """
 
-def set_wardID(df, boundary):
-    boundary_sql = boundary.drop(["geometry","city_centroid"], axis=1)
-    query = f"""
-    SELECT DISTINCT
-        IFNULL(IFNULL(IFNULL(gadm.ward_id, gadm_ward.ward_id), gadm_full.ward_id), gadm_en.ward_id) AS ward_id,
-        df.*
-    FROM df
-    LEFT JOIN boundary_sql gadm
-    ON df.city = gadm.city AND df.district = gadm.district AND df.ward = gadm.ward
-    LEFT JOIN boundary_sql gadm_ward
-    ON df.city = gadm_ward.city AND df.district = gadm_ward.district AND REPLACE(df.ward_org,' ','') = gadm_ward.ward
-    LEFT JOIN boundary_sql gadm_full
-    ON df.city = gadm_full.city AND REPLACE(df.district_org,' ','') = gadm_full.district AND REPLACE(df.ward_org,' ','') = gadm_full.ward
-    LEFT JOIN boundary_sql gadm_en
-    ON df.city = gadm_en.city AND df.dist_en = gadm_en.dist_en AND df.ward_en = gadm_en.ward_en
-    """
-    df_with_id = duckdb.default_connection.sql(query).df()
+# Columns only used to match datasets with each other
+KEY_COLS = ["city","district","ward","district_org","ward_org","dist_id","ward_id","dist_en","ward_en"]
+WARD_JOIN_COLS = ["ward_id","city","district_org","ward_org","district","ward"]
+# Fuzzy matches of the last refresh, to check the rejected ones and fix their names
+REVIEW_DIR = os.path.join(CACHE_DIR, "review")
+
+def save_review(matcher, level, name):
+    review = matcher.review.get(level)
+    if review is None:
+        return
+    annotate(fuzzy_review=int((~review["accepted"]).sum()))
+    os.makedirs(REVIEW_DIR, exist_ok=True)
+    review.to_csv(os.path.join(REVIEW_DIR, f"{name}.csv"), encoding="utf-8-sig")
+
+@instrumented()
+def set_wardID(df, boundary, review_name="ward"):
+    # Cascading match: exact names, then original names, then names without diacritics, then fuzzy names
+    df_with_id = df.copy()
+    matcher = get_matcher(boundary)
+    df_with_id["ward_id"] = matcher.match(df, "ward")
+    annotate(match_rate=match_rate(df_with_id["ward_id"]), hits=matcher.hits["ward"])
+    save_review(matcher, "ward", review_name)
     # Rearrange columns and remove unnecessary ones
-    cols = df_with_id.columns.tolist()
-    cols = cols[0:2] + cols[-6:-4] + cols[2:-6]
+    cols = ["ward_id","city","district_org","ward_org","district","ward"] + [col for col in df.columns if col not in KEY_COLS]
     return df_with_id[cols]
 
-def set_distID(df, boundary):
-    boundary_sql = boundary.drop(["geometry","city_centroid"], axis=1)
-    query = f"""
-    SELECT DISTINCT
-        IFNULL(IFNULL(gadm.dist_id, gadm_full.dist_id), gadm_en.dist_id) AS dist_id,
-        pop.*
-    FROM df pop
-    LEFT JOIN boundary_sql gadm
-    ON pop.city = gadm.city AND pop.district = gadm.district
-    LEFT JOIN boundary_sql gadm_full
-    ON pop.city = gadm_full.city AND REPLACE(pop.district_org,' ','') = gadm_full.district
-    LEFT JOIN boundary_sql gadm_en
-    ON pop.city = gadm_en.city AND pop.dist_en = gadm_en.dist_en
-    """
-    df_with_id = duckdb.default_connection.sql(query).df()
+@instrumented()
+def set_distID(df, boundary, review_name="district"):
+    df_with_id = df.copy()
+    matcher = get_matcher(boundary)
+    df_with_id["dist_id"] = matcher.match(df, "district")
+    annotate(match_rate=match_rate(df_with_id["dist_id"]), hits=matcher.hits["district"])
+    save_review(matcher, "district", review_name)
     # Rearrange columns and remove unnecessary ones
-    cols = df_with_id.columns.tolist()
-    cols = cols[0:2] + cols[-3:-2] + cols[2:-3]
+    cols = ["dist_id","city","district_org","district"] + [col for col in df.columns if col not in KEY_COLS]
     return df_with_id[cols]
 
-def exec(admin_level):
-    # Get population enhanced data
-    df_allpop = population(population_size="all")
-    df_householdpop = population(population_size="household")
-    df_youngpop = population(population_size="young")
-    # Get GADM enhanced data
-    ward_boundaries = boundaries(admin_level="ward")
-    dist_boundaries = boundaries(admin_level="district")
+@instrumented()
+def demographic_ward(df_allpop, df_householdpop, ward_boundaries):
     # Population by Ward
-    df_allpop_with_id = set_wardID(df_allpop, ward_boundaries)
+    df_allpop_with_id = set_wardID(df_allpop, ward_boundaries, "ward_allpop")
     # Population by Ward
-    df_householdpop_with_id = set_wardID(df_householdpop, ward_boundaries)
-    df_demographic_ward = pd.merge(df_allpop_with_id, df_householdpop_with_id, how="inner", on=["ward_id","city","district_org","ward_org","district","ward"])
+    df_householdpop_with_id = set_wardID(df_householdpop, ward_boundaries, "ward_household")
+    # Compact layout: ward_id as keys of the boundary IDs, names sharing their categories on both sides,
+    # so that the merge runs on integer codes
+    lookups = {"ward_id": IdLookup.from_boundary(ward_boundaries, "ward_id")}
+    categories = shared_categories([df_allpop_with_id, df_householdpop_with_id], WARD_JOIN_COLS[1:])
+    df_allpop_with_id = compact(df_allpop_with_id, lookups, categories)
+    df_householdpop_with_id = compact(df_householdpop_with_id, lookups, categories)
+    df_demographic_ward = pd.merge(df_allpop_with_id, df_householdpop_with_id, how="inner", on=WARD_JOIN_COLS)
+    # Rows of either side without a counterpart are dropped by the inner merge
+    annotate(rows_allpop=len(df_allpop_with_id), rows_household=len(df_householdpop_with_id))
+    return df_demographic_ward
+
+@instrumented()
+def demographic_dist(df_youngpop, dist_boundaries):
     # Young population by District
-    df_youngpop_with_id = set_distID(df_youngpop, dist_boundaries)
-    df_demographic_dist = df_youngpop_with_id.copy()
-    return df_demographic_ward if admin_level=="ward" else df_demographic_dist
+    df_youngpop_with_id = set_distID(df_youngpop, dist_boundaries, "district_youngpop")
+    df_demographic_dist = compact(df_youngpop_with_id, {"dist_id": IdLookup.from_boundary(dist_boundaries, "dist_id")})
+    return df_demographic_dist
+
+@instrumented()
+def exec(admin_level):
+    # Only the datasets needed for the requested level are built
+    if admin_level=="ward":
+        # Get population enhanced data
+        datasets = population("all", "household")
+        # Get GADM enhanced data
+        ward_boundaries = boundaries(admin_level="ward")
+        return demographic_ward(datasets["all"], datasets["household"], ward_boundaries)
+    df_youngpop = population("young")["young"]
+    dist_boundaries = boundaries(admin_level="district")
+    return demographic_dist(df_youngpop, dist_boundaries)
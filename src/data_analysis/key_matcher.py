@@ -0,0 +1,172 @@
+import re
+import weakref
+from difflib import SequenceMatcher
+import numpy as np
+import pandas as pd
+
+"""
+Cascading matcher from administrative names to GADM's IDs.
+Each key tier is a hash index over the boundary table, built once per boundary set and per level.
+A row is resolved at the first tier that hits, so there is no fan-out to remove afterwards.
+Rows missed by every tier go through a fuzzy stage: their diacritic-free names are scored against the
+few candidates of the same city & district only (blocking) that no other row has claimed, as census rows are
+one per ward. The best candidate is accepted above ACCEPT_SCORE and the others are left for review in
+`matcher.review`.
+"""
+
+# Key tiers as (name, [(dataset column, boundary column), ...]), from the most to the least strict
+# The original administrative names (*_org) are compared without spaces
+TIERS = {
+    "ward": [("exact", [("city","city"), ("district","district"), ("ward","ward")]),
+             ("ward_org", [("city","city"), ("district","district"), ("ward_org","ward")]),
+             ("full_org", [("city","city"), ("district_org","district"), ("ward_org","ward")]),
+             ("en", [("city","city"), ("dist_en","dist_en"), ("ward_en","ward_en")])],
+    "district": [("exact", [("city","city"), ("district","district")]),
+                 ("full_org", [("city","city"), ("district_org","district")]),
+                 ("en", [("city","city"), ("dist_en","dist_en")])],
+}
+ID_COLS = {"ward": "ward_id", "district": "dist_id"}
+SEPARATOR = "\x1f"
+
+# Fuzzy stage as (blocks, scored columns), each a list of (dataset column, boundary column).
+# Blocks are tried in order: a ward whose district isn't found is scored on district & ward names within its city
+FUZZY = {
+    "ward": [([("city","city"), ("dist_en","dist_en")], [("ward_en","ward_en")]),
+             ([("city","city")], [("dist_en","dist_en"), ("ward_en","ward_en")])],
+    "district": [([("city","city")], [("dist_en","dist_en")])],
+}
+# Similarity from which the best candidate is accepted, if no other candidate comes within MARGIN of it
+ACCEPT_SCORE = 0.8
+MARGIN = 0.05
+_NUMBERS = re.compile(r"[0-9]+")
+# Titles left in the diacritic-free names by one dataset but not the other (phuong12 / 12)
+_TITLES = re.compile(r"^(phuong|thitran|xa|quan|huyen|thixa|thanhpho|tinh)(?=.)")
+
+def join_keys(df, cols):
+    # One hashable string key per row, missing if any part is missing
+    parts = [df[col].str.replace(" ","") if col.endswith("_org") else df[col] for col in cols]
+    return parts[0].str.cat(parts[1:], sep=SEPARATOR) if len(parts) > 1 else parts[0]
+
+def similarity(a, b):
+    # Edit similarity in [0, 1] of the names without titles, names with different numbers (Phường 1/Phường 11) never match
+    if _NUMBERS.findall(a) != _NUMBERS.findall(b):
+        return 0.0
+    return SequenceMatcher(None, _TITLES.sub("", a), _TITLES.sub("", b)).ratio()
+
+class KeyMatcher:
+    def __init__(self, boundary):
+        # Only the key columns are kept, not the geometries
+        cols = {col for tiers in TIERS.values() for _, keys in tiers for _, col in keys} | set(ID_COLS.values())
+        self.boundary = pd.DataFrame(boundary[[col for col in boundary.columns if col in cols]])
+        self.indexes = {}
+        self.blocks = {}
+        # Hit count of every tier in the last match, per level
+        self.hits = {}
+        # Rows of the last match scored by the fuzzy stage, per level: best candidate, score and whether it's accepted
+        self.review = {}
+
+    def index(self, level):
+        # Hash index of every key tier, built on first use
+        if level not in self.indexes:
+            ids = self.boundary[ID_COLS[level]].to_numpy()
+            tiers = []
+            for name, keys in TIERS[level]:
+                key = join_keys(self.boundary, [b for _, b in keys])
+                # Keep the first boundary for each key
+                valid = (key.notna() & ~key.duplicated()).to_numpy()
+                tiers.append((name, keys, pd.Index(key[valid]), ids[valid]))
+            self.indexes[level] = tiers
+        return self.indexes[level]
+
+    def block_index(self, level, i):
+        # Positions of the boundaries of every block, and their names to score, built on first use
+        if (level, i) not in self.blocks:
+            block_cols, score_cols = FUZZY[level][i]
+            key = join_keys(self.boundary, [b for _, b in block_cols])
+            self.blocks[level, i] = (key.reset_index(drop=True).groupby(key.to_numpy(), sort=False).indices,
+                                     join_keys(self.boundary, [b for _, b in score_cols]).to_numpy())
+        return self.blocks[level, i]
+
+    def fuzzy_match(self, df, level, claimed=()):
+        # Best candidate of every row within its block: (boundary position, score), -1 & NaN if there is none
+        # Boundaries whose ID is already claimed are not candidates, accepted ones are claimed in turn
+        ids, claimed = self.boundary[ID_COLS[level]].to_numpy(), set(claimed)
+        positions = np.full(len(df), -1, dtype=np.int64)
+        scores = np.full(len(df), np.nan)
+        accepted = np.zeros(len(df), dtype=bool)
+        todo = np.arange(len(df))
+        for i, (block_cols, score_cols) in enumerate(FUZZY[level]):
+            if not len(todo):
+                break
+            blocks, candidates = self.block_index(level, i)
+            block = join_keys(df.iloc[todo], [d for d, _ in block_cols]).to_numpy()
+            names = join_keys(df.iloc[todo], [d for d, _ in score_cols]).to_numpy()
+            in_block = np.array([key in blocks for key in block], dtype=bool)
+            # Each distinct (block, name) is scored once
+            results = []
+            for (key, name), rows in pd.DataFrame({"block": block[in_block], "name": names[in_block]}).groupby(
+                    ["block","name"], sort=False).indices.items():
+                ranked = sorted(((similarity(name, candidates[m]), m) for m in blocks[key]
+                                 if ids[m] not in claimed and isinstance(candidates[m], str)), reverse=True)
+                if not ranked or ranked[0][0] == 0:
+                    continue
+                best, position = ranked[0]
+                runner_up = ranked[1][0] if len(ranked) > 1 else 0.0
+                results.append((best, best - runner_up, position, todo[np.flatnonzero(in_block)[rows]]))
+            # The closest names claim their boundary first, other names whose best candidate is claimed are left for review
+            for best, gap, position, rows in sorted(results, key=lambda result: -result[0]):
+                positions[rows], scores[rows] = position, best
+                if best >= ACCEPT_SCORE and gap >= MARGIN and ids[position] not in claimed:
+                    accepted[rows] = True
+                    claimed.add(ids[position])
+            todo = todo[~in_block]
+        return positions, scores, accepted
+
+    def match(self, df, level, fuzzy=True):
+        # GADM's ID of every row of df (missing if no tier hits)
+        matched = np.full(len(df), None, dtype=object)
+        todo = np.arange(len(df))
+        hits = {}
+        for name, keys, index, ids in self.index(level):
+            key = join_keys(df.iloc[todo], [d for d, _ in keys])
+            positions = index.get_indexer(key)
+            found = positions >= 0
+            matched[todo[found]] = ids[positions[found]]
+            hits[name] = int(found.sum())
+            todo = todo[~found]
+        self.review[level] = None
+        if fuzzy and len(todo):
+            positions, scores, accepted = self.fuzzy_match(df.iloc[todo], level, claimed=matched[matched != None])
+            ids = self.boundary[ID_COLS[level]].to_numpy()
+            matched[todo[accepted]] = ids[positions[accepted]]
+            self.review[level] = self.review_table(df.iloc[todo], level, positions, scores, accepted)
+            hits["fuzzy"] = int(accepted.sum())
+            todo = todo[~accepted]
+        hits["unmatched"] = len(todo)
+        self.hits[level] = hits
+        return pd.Series(matched, index=df.index, name=ID_COLS[level])
+
+    def review_table(self, df, level, positions, scores, accepted):
+        # Names of the rows next to their best candidate, the rejected ones are to be fixed by hand
+        cols = list(dict.fromkeys(col for blocks, scored in FUZZY[level] for keys in (blocks, scored) for col, _ in keys))
+        candidate_cols = list(dict.fromkeys(col for blocks, scored in FUZZY[level] for keys in (blocks, scored) for _, col in keys))
+        review = df[[col for col in cols if col in df]].copy()
+        found = positions >= 0
+        candidates = self.boundary.iloc[np.where(found, positions, 0)][candidate_cols + [ID_COLS[level]]]
+        for col in candidates.columns:
+            review["candidate_"+col] = np.where(found, candidates[col].to_numpy(dtype=object), None)
+        review["score"] = np.round(scores, 3)
+        review["accepted"] = accepted
+        return review
+
+# One matcher per boundary set, so that several datasets reuse the same indexes
+_matchers = {}
+
+def get_matcher(boundary):
+    key = id(boundary)
+    ref, matcher = _matchers.get(key, (None, None))
+    if ref is None or ref() is not boundary:
+        matcher = KeyMatcher(boundary)
+        # Forget the matcher together with its boundary set
+        _matchers[key] = (weakref.ref(boundary, lambda _: _matchers.pop(key, None)), matcher)
+    return matcher
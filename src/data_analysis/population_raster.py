@@ -0,0 +1,168 @@
+import os
+import json
+import numpy as np
+import shapely
+from pyproj import Transformer
+from src.utils.artifact_cache import CACHE_DIR
+from src.data_quality.admin_keys import to_en
+from src.data_analysis.catchment import ward_population, AREA_CRS, POPULATION
+
+"""
+Ward population spread on a regular grid (100m cells in the equal-area EPSG:6933, as in vn_boundaries.build_hierarchy).
+Along with the grid, a summed-area (integral) table is kept: the population of any rectangle of cells is
+    S[r1,c1] - S[r0,c1] - S[r1,c0] + S[r0,c0]
+so a rectangle costs 4 lookups and a circle a fixed number of rectangles, whatever their size.
+Both arrays are saved as .npy files and opened memory-mapped, so all dashboard and batch workers share
+the same copy in the OS page cache.
+"""
+
+RASTER_DIR = os.path.join(CACHE_DIR, "raster")
+CELL_SIZE = 100
+# Number of horizontal strips approximating a circle
+CIRCLE_STRIPS = 8
+
+def rasterize(wards, cell_size):
+    # Spread the population of every ward evenly over the cells whose center falls in it
+    wards = wards.to_crs(epsg=AREA_CRS)
+    xmin, ymin, xmax, ymax = wards.total_bounds
+    left, top = np.floor(xmin / cell_size) * cell_size, np.ceil(ymax / cell_size) * cell_size
+    width = int(np.ceil((xmax - left) / cell_size))
+    height = int(np.ceil((top - ymin) / cell_size))
+    geoms = wards.geometry.values
+    values = wards[POPULATION].to_numpy()
+    shapely.prepare(geoms)
+
+    # Each ward is only tested against the cell centers of its bounding box
+    cell_idx, ward_idx = [], []
+    for i, (x0, y0, x1, y1) in enumerate(shapely.bounds(geoms)):
+        col0, col1 = max(int(np.ceil((x0 - left) / cell_size - 0.5)), 0), min(int(np.floor((x1 - left) / cell_size - 0.5)), width - 1)
+        row0, row1 = max(int(np.ceil((top - y1) / cell_size - 0.5)), 0), min(int(np.floor((top - y0) / cell_size - 0.5)), height - 1)
+        if col0 > col1 or row0 > row1:
+            continue
+        cols, rows = np.meshgrid(np.arange(col0, col1 + 1), np.arange(row0, row1 + 1))
+        cols, rows = cols.ravel(), rows.ravel()
+        inside = shapely.contains_xy(geoms[i], left + (cols + 0.5) * cell_size, top - (rows + 0.5) * cell_size)
+        cell_idx.append(rows[inside].astype(np.int64) * width + cols[inside])
+        ward_idx.append(np.full(int(inside.sum()), i))
+    cell_idx = np.concatenate(cell_idx) if cell_idx else np.zeros(0, dtype=np.int64)
+    ward_idx = np.concatenate(ward_idx) if ward_idx else np.zeros(0, dtype=np.int64)
+    # A cell center in overlapping wards belongs to the first ward only
+    cell_idx, first = np.unique(cell_idx, return_index=True)
+    ward_idx = ward_idx[first]
+    # Wards smaller than a cell get the cell of their representative point
+    missing = np.setdiff1d(np.arange(len(geoms)), ward_idx)
+    extra_cells = np.zeros(0, dtype=np.int64)
+    if len(missing):
+        points = shapely.get_coordinates(shapely.point_on_surface(geoms[missing]))
+        extra_cols = np.clip(((points[:,0] - left) // cell_size).astype(np.int64), 0, width - 1)
+        extra_rows = np.clip(((top - points[:,1]) // cell_size).astype(np.int64), 0, height - 1)
+        extra_cells = extra_rows * width + extra_cols
+    cells_per_ward = np.bincount(np.r_[ward_idx, missing], minlength=len(geoms))
+
+    # Cells are unique after np.unique, only the cells of small wards can add up
+    raster = np.zeros((len(POPULATION), height * width), dtype=np.float32)
+    for k in range(len(POPULATION)):
+        raster[k, cell_idx] = values[ward_idx, k] / cells_per_ward[ward_idx]
+        np.add.at(raster[k], extra_cells, values[missing, k] / cells_per_ward[missing])
+    meta = {"crs": AREA_CRS, "left": float(left), "top": float(top), "cell_size": cell_size,
+            "height": height, "width": width, "layers": POPULATION}
+    return raster.reshape(len(POPULATION), height, width), meta
+
+def summed_area_table(raster, out=None):
+    # S[:, i, j] = sum of raster[:, :i, :j], computed one layer at a time (into `out`, e.g. a memory-mapped file)
+    if out is None:
+        out = np.zeros((raster.shape[0], raster.shape[1] + 1, raster.shape[2] + 1))
+    for k in range(raster.shape[0]):
+        out[k, 0, :] = 0
+        out[k, :, 0] = 0
+        np.cumsum(raster[k], axis=0, dtype=np.float64, out=out[k, 1:, 1:])
+        np.cumsum(out[k, 1:, 1:], axis=1, out=out[k, 1:, 1:])
+    return out
+
+def _save(path, array):
+    # Write then rename, so that a worker never maps a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+def _save_summed_area_table(path, raster):
+    # Built straight into the file, as the float64 table of a national grid does not fit in memory
+    tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+    sat = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float64,
+                                    shape=(raster.shape[0], raster.shape[1] + 1, raster.shape[2] + 1))
+    summed_area_table(raster, out=sat)
+    sat.flush()
+    del sat
+    os.replace(tmp_path, path)
+
+def build_raster(ward_boundaries, df_demographic_ward, df_demographic_dist, city=None, cell_size=CELL_SIZE, out_dir=RASTER_DIR):
+    """
+    Rasterize the population of a city (or the whole country, if city is None) and save it with its
+    summed-area table. Returns the directory to open with PopulationRaster.
+    """
+    wards = ward_population(ward_boundaries, df_demographic_ward, df_demographic_dist)
+    if city is not None:
+        wards = wards[wards["ward_id"].isin(ward_boundaries.loc[ward_boundaries["city"]==city, "ward_id"])]
+    raster, meta = rasterize(wards, cell_size)
+    path = os.path.join(out_dir, f"{to_en(city) if city else 'vietnam'}-{cell_size}m")
+    os.makedirs(path, exist_ok=True)
+    _save(os.path.join(path, "raster.npy"), raster)
+    _save_summed_area_table(os.path.join(path, "sat.npy"), raster)
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    return path
+
+class PopulationRaster:
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        # Memory-mapped: nothing is read until queried, and pages are shared between processes
+        self.raster = np.load(os.path.join(path, "raster.npy"), mmap_mode="r")
+        self.sat = np.load(os.path.join(path, "sat.npy"), mmap_mode="r")
+        self.height, self.width = self.meta["height"], self.meta["width"]
+        self.transformer = Transformer.from_crs(4326, self.meta["crs"], always_xy=True)
+
+    def window(self, row0, col0, row1, col1):
+        """
+        Population of the cells [row0:row1, col0:col1] (one row per layer for arrays of windows).
+        Windows are clipped to the grid, empty windows sum to 0.
+        """
+        row0, row1 = np.clip(row0, 0, self.height), np.clip(row1, 0, self.height)
+        col0, col1 = np.clip(col0, 0, self.width), np.clip(col1, 0, self.width)
+        row1, col1 = np.maximum(row0, row1), np.maximum(col0, col1)
+        s = self.sat
+        return s[:, row1, col1] - s[:, row0, col1] - s[:, row1, col0] + s[:, row0, col0]
+
+    def to_grid(self, lats, lons):
+        # Position of the points in the grid (fractional row, col)
+        x, y = self.transformer.transform(np.asarray(lons, dtype=float), np.asarray(lats, dtype=float))
+        cell_size = self.meta["cell_size"]
+        return (self.meta["top"] - y) / cell_size, (x - self.meta["left"]) / cell_size
+
+    def rectangle(self, lat_min, lon_min, lat_max, lon_max):
+        rows, cols = self.to_grid([lat_max, lat_min], [lon_min, lon_max])
+        return dict(zip(POPULATION, self.window(int(np.floor(rows[0])), int(np.floor(cols[0])),
+                                                int(np.ceil(rows[1])), int(np.ceil(cols[1])))))
+
+    def circles(self, lats, lons, radius):
+        """
+        Approximate population within `radius` meters of every point, as a stack of CIRCLE_STRIPS rectangles.
+        In EPSG:6933 a ground circle is an ellipse, stretched by cos(30°)/cos(lat) along x and shrunk along y.
+        """
+        lats = np.asarray(lats, dtype=float)
+        rows, cols = self.to_grid(lats, lons)
+        stretch = np.cos(np.radians(30)) / np.cos(np.radians(lats))
+        half_height = radius / stretch / self.meta["cell_size"]
+        half_width = radius * stretch / self.meta["cell_size"]
+        total = np.zeros((len(POPULATION), len(lats)))
+        edges = np.linspace(-1, 1, CIRCLE_STRIPS + 1)
+        for lower, upper in zip(edges[:-1], edges[1:]):
+            # Strip as wide as the circle at its middle
+            middle = (lower + upper) / 2
+            width = np.sqrt(1 - middle**2)
+            row0 = np.rint(rows + lower * half_height).astype(np.int64)
+            row1 = np.rint(rows + upper * half_height).astype(np.int64)
+            col0 = np.rint(cols - width * half_width).astype(np.int64)
+            col1 = np.rint(cols + width * half_width).astype(np.int64)
+            total += self.window(row0, col0, row1, col1)
+        return {name: total[k] for k, name in enumerate(POPULATION)}
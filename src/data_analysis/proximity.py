@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from src.utils import excel_mirror
+from src.data_quality.store_locations import exec as store_locations
+
+"""
+Distances between the stores of each brand, competitors and candidate sites.
+Points are indexed per brand in a KD-tree on the unit sphere (x, y, z): the straight-line (chord) distance
+grows with the great-circle distance, so nearest neighbours and radius counts are exact haversine results,
+in O(log n) per query instead of comparing every pair of points.
+"""
+
+CAFE_PATH = r"data\Cafe location (cleaned).xlsx"
+# Mean Earth radius, in meters
+EARTH_RADIUS = 6371008.8
+
+def to_xyz(lats, lons):
+    lats, lons = np.radians(np.asarray(lats, dtype=float)), np.radians(np.asarray(lons, dtype=float))
+    return np.column_stack([np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)])
+
+def chord_to_meters(chord):
+    return 2 * EARTH_RADIUS * np.arcsin(np.clip(chord / 2, 0, 1))
+
+def meters_to_chord(meters):
+    return 2 * np.sin(np.asarray(meters, dtype=float) / (2 * EARTH_RADIUS))
+
+def load_brands(cafe_by_brand=False):
+    """
+    Coordinates (lat, long) of every brand: Winmart and BHX stores, and cafes.
+    Cafes are one "cafe" brand, or one brand per chain with cafe_by_brand=True.
+    """
+    wcm_stores = store_locations("Winmart")
+    bhx_stores = store_locations("BHX").rename(columns={"lng":"long"})
+    brands = {"Winmart": wcm_stores[["lat","long"]], "BHX": bhx_stores[["lat","long"]]}
+    # Cafe ids mix numbers and text
+    cafes = excel_mirror.read_excel(CAFE_PATH, dtype={"id": str})
+    if cafe_by_brand:
+        brands.update({brand: df[["lat","long"]] for brand, df in cafes.groupby("brand")})
+    else:
+        brands["cafe"] = cafes[["lat","long"]]
+    return brands
+
+class ProximityIndex:
+    def __init__(self, brands):
+        # brands: {brand: DataFrame with lat/long}, e.g. from load_brands
+        self.trees = {}
+        for brand, df in brands.items():
+            df = df.dropna(subset=["lat","long"])
+            self.trees[brand] = cKDTree(to_xyz(df["lat"], df["long"]))
+
+    def nearest(self, lats, lons, brand, k=1, exclude_self=False):
+        """
+        Distances (meters) from every point to its k nearest stores of `brand`, shape (points, k).
+        With exclude_self, the points are the brand's own stores and the store itself is skipped.
+        Missing neighbours (brand with fewer than k stores) are NaN.
+        """
+        tree = self.trees[brand]
+        skip = 1 if exclude_self else 0
+        chord, _ = tree.query(to_xyz(lats, lons), k=list(range(1 + skip, k + 1 + skip)))
+        return np.where(np.isinf(chord), np.nan, chord_to_meters(chord))
+
+    def count_within(self, lats, lons, brand, radius, exclude_self=False):
+        # Number of stores of `brand` within `radius` meters of every point
+        counts = self.trees[brand].query_ball_point(to_xyz(lats, lons), meters_to_chord(radius), return_length=True)
+        return counts - 1 if exclude_self else counts
+
+    def metrics(self, lats, lons, k=1, radii=(500, 1000), own_brand=None, index=None):
+        """
+        Proximity of every point to all brands:
+        - "dist_<brand>_<i>": distance (meters) to the i-th nearest store of the brand
+        - "count_<brand>_<radius>m": number of stores of the brand within the radius
+        When the points are the stores of `own_brand`, each store is left out of its own brand's metrics.
+        Give the index of the stores to merge the result back on them.
+        """
+        result = {}
+        for brand in self.trees:
+            exclude_self = brand==own_brand
+            distances = self.nearest(lats, lons, brand, k=k, exclude_self=exclude_self)
+            for i in range(k):
+                result[f"dist_{brand}_{i+1}"] = distances[:, i]
+            for radius in radii:
+                result[f"count_{brand}_{radius}m"] = self.count_within(lats, lons, brand, radius, exclude_self=exclude_self)
+        return pd.DataFrame(result, index=index)
+
+def exec(brand, k=1, radii=(500, 1000)):
+    # Store locations of the brand ("Winmart"/"BHX") with their proximity to every brand
+    stores = store_locations(brand)
+    lat, lon = stores["lat"], stores["long" if brand=="Winmart" else "lng"]
+    located = lat.notna() & lon.notna()
+    index = ProximityIndex(load_brands())
+    metrics = index.metrics(lat[located], lon[located], k=k, radii=radii, own_brand=brand, index=stores.index[located])
+    return stores.join(metrics)
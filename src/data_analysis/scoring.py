@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+"""
+Location scoring of every ward of the country.
+All features are computed once into a standardized matrix, so that the score of ~10k wards for any set
+of weights is a single matrix-vector product, and ranking the top-K wards is a vectorized sort.
+"""
+
+# Default weight of each feature, store features are named "stores_<brand>"
+DEFAULT_WEIGHTS = {"density": 1.0,
+                   "young_share": 0.5,
+                   "family_household_share": 0.3,
+                   "urban_share": 0.5,
+                   "stores_own": -1.0,
+                   "stores_competitor": -0.5}
+HOUSEHOLD_COLS = ["1_urban","2_urban","3_urban","4_urban","5+_urban","1-2_rural","3_rural","4_rural","5+_rural"]
+FAMILY_HOUSEHOLD_COLS = ["3_urban","4_urban","5+_urban","3_rural","4_rural","5+_rural"]
+
+def count_stores(df_stores, ward_ids):
+    # Number of stores in each ward
+    return df_stores["ward_id"].value_counts().reindex(ward_ids, fill_value=0).to_numpy()
+
+def build_features(df_demographic_ward, ward_boundaries, df_demographic_dist, stores, own_brand="Winmart"):
+    """
+    One row per ward with every scoring feature.
+    - df_demographic_ward/df_demographic_dist: density.exec("ward")/density.exec("district")
+    - ward_boundaries: vn_boundaries.exec("ward"), for area_sqm and dist_id
+    - stores: {brand: stores with a ward_id column}, e.g. from store_locations.exec
+    """
+    wards = df_demographic_ward.dropna(subset=["ward_id"]).drop_duplicates("ward_id")
+    wards = pd.merge(wards, pd.DataFrame(ward_boundaries[["ward_id","dist_id","area_sqm"]]), how="inner", on="ward_id")
+    counts = wards[["total","urban"] + HOUSEHOLD_COLS].fillna(0).astype(float)
+    total = counts["total"].to_numpy()
+
+    features = wards[["ward_id","dist_id","city","district","ward"]].copy()
+    # People per km²
+    features["density"] = np.log1p(total / wards["area_sqm"].to_numpy() * 1e6)
+    features["urban_share"] = np.divide(counts["urban"].to_numpy(), total, out=np.zeros(len(total)), where=total > 0)
+    households = counts[HOUSEHOLD_COLS].sum(axis=1).to_numpy()
+    family = counts[FAMILY_HOUSEHOLD_COLS].sum(axis=1).to_numpy()
+    features["family_household_share"] = np.divide(family, households, out=np.zeros(len(total)), where=households > 0)
+    # Young population is only known by district: 15-34 population over the district population
+    dist_total = pd.Series(total).groupby(wards["dist_id"].to_numpy()).sum()
+    young = df_demographic_dist.dropna(subset=["dist_id"]).drop_duplicates("dist_id").set_index("dist_id")["15-34_total"]
+    features["young_share"] = (young / dist_total).reindex(wards["dist_id"]).fillna(0).to_numpy()
+
+    for brand, df_stores in stores.items():
+        features[f"stores_{brand}"] = count_stores(df_stores, features["ward_id"])
+    features["stores_own"] = features[f"stores_{own_brand}"] if f"stores_{own_brand}" in features else 0
+    competitors = [f"stores_{brand}" for brand in stores if brand != own_brand]
+    features["stores_competitor"] = features[competitors].sum(axis=1) if competitors else 0
+    return features.reset_index(drop=True)
+
+class WardScorer:
+    def __init__(self, features):
+        self.info = features[["ward_id","dist_id","city","district","ward"]].reset_index(drop=True)
+        self.columns = [col for col in features.columns if col not in self.info.columns]
+        values = features[self.columns].to_numpy(dtype=float)
+        # Standardize features, so that weights are comparable
+        std = values.std(axis=0)
+        self.matrix = np.nan_to_num((values - values.mean(axis=0)) / np.where(std > 0, std, 1))
+        self.cities = self.info["city"].to_numpy()
+
+    def weight_vector(self, weights):
+        unknown = set(weights) - set(self.columns)
+        if unknown:
+            raise KeyError(f"Unknown scoring features: {sorted(unknown)}")
+        return np.array([weights.get(col, 0.0) for col in self.columns])
+
+    def score(self, weights=None):
+        # Score of every ward
+        return self.matrix @ self.weight_vector(weights or DEFAULT_WEIGHTS)
+
+    def top_k(self, k=10, weights=None, by="city", city=None):
+        """
+        Best k wards, per city (by="city") or nationally (by=None).
+        Give `city` to rank the wards of a single city.
+        """
+        scores = self.score(weights)
+        mask = np.ones(len(scores), dtype=bool) if city is None else self.cities == city
+        idx = np.flatnonzero(mask)
+        if by is None or city is not None:
+            best = idx[np.argsort(-scores[idx], kind="stable")[:k]]
+        else:
+            # Sort by city then score, and keep the first k of each city
+            order = idx[np.lexsort((-scores[idx], self.cities[idx]))]
+            groups = self.cities[order]
+            starts = np.r_[0, np.flatnonzero(groups[1:] != groups[:-1]) + 1]
+            rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+            best = order[rank < k]
+        ranking = self.info.iloc[best].copy()
+        ranking["score"] = scores[best]
+        return ranking.reset_index(drop=True)
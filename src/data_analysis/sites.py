@@ -0,0 +1,125 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from src.data_analysis.ward_lookup import WardLookup
+from src.data_analysis.scoring import count_stores
+from src.data_analysis.cube import ward_figures
+from src.utils.instrument import instrumented, annotate
+
+"""
+Batch enrichment of candidate sites (lat/long points) with the figures of the ward they fall in:
+ward & district, population, households by size, young population and store counts by brand.
+Sites are read, enriched and written chunk by chunk, so memory stays flat whatever the file size:
+- every ward figure is computed once into a table aligned with the ward polygons, a chunk is then one
+  STRtree point-in-polygon query and one positional take from that table
+- with several workers, chunks are enriched in parallel processes while at most 2 chunks per worker
+  are in flight, and written in input order
+"""
+
+CHUNK_SIZE = 100_000
+
+def ward_table(ward_boundaries, df_demographic_ward, df_demographic_dist, stores):
+    """
+    One row per ward polygon (same order as ward_boundaries) with every figure attached to the sites.
+    - df_demographic_ward/df_demographic_dist: density.exec("ward")/density.exec("district")
+    - stores: {brand: stores with a ward_id column}, e.g. from store_locations.exec
+    """
+    wards = ward_figures(ward_boundaries, df_demographic_ward, df_demographic_dist)
+    for brand, df_stores in stores.items():
+        wards[f"stores_{brand}"] = pd.array(count_stores(df_stores, wards["ward_id"]), dtype="Int32")
+    # Empty last row, picked by the -1 position of sites outside every ward
+    return pd.concat([wards, pd.DataFrame(index=[len(wards)], columns=wards.columns).astype(wards.dtypes)])
+
+def load_ward_table():
+    # Imported here as building the tables runs the whole pipeline
+    from src.data_quality.vn_boundaries import exec as boundaries
+    from src.data_quality.store_locations import exec as store_locations
+    from src.data_analysis.density import exec as demographic
+    ward_boundaries = boundaries("ward")
+    stores = {brand: store_locations(brand) for brand in ["Winmart","BHX"]}
+    table = ward_table(ward_boundaries, demographic("ward"), demographic("district"), stores)
+    return ward_boundaries[["ward_id","geometry"]].to_crs(4326), table
+
+@instrumented("sites.enrich")
+def enrich(sites, lookup, table, lat_col="lat", lon_col="long"):
+    # The sites with the figures of their ward, sites without coordinates or outside every ward get empty figures
+    positions = lookup.locate_many(sites[lon_col], sites[lat_col])
+    annotate(located=int((positions >= 0).sum()))
+    figures = table.iloc[positions].reset_index(drop=True)
+    figures.index = sites.index
+    return pd.concat([sites, figures.drop(columns=[col for col in figures.columns if col in sites.columns])], axis=1)
+
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    # DataFrames of at most chunk_size rows, from a CSV or Parquet file
+    if path.lower().endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+class ChunkWriter:
+    # Appends chunks to a CSV or Parquet file, Parquet columns keep the types of the first chunk
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.lower().endswith(".parquet")
+        self.writer = None
+        self.rows = 0
+
+    def write(self, df):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            if self.writer is None:
+                schema = pa.Schema.from_pandas(df, preserve_index=False)
+                # Columns that are all empty in the first chunk are text
+                for i, field in enumerate(schema):
+                    if pa.types.is_null(field.type):
+                        schema = schema.set(i, field.with_type(pa.string()))
+                self.writer = pq.ParquetWriter(self.path, schema)
+            self.writer.write_table(pa.Table.from_pandas(df, schema=self.writer.schema, preserve_index=False))
+        else:
+            df.to_csv(self.path, mode="w" if self.rows == 0 else "a", header=self.rows == 0, index=False, encoding="utf-8")
+        self.rows += len(df)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+# Ward lookup and table of each worker process, set once by _init_worker
+_worker = {}
+
+def _init_worker(boundary, table, lat_col, lon_col):
+    _worker.update(lookup=WardLookup(boundary), table=table, lat_col=lat_col, lon_col=lon_col)
+
+def _enrich_chunk(sites):
+    return enrich(sites, _worker["lookup"], _worker["table"], _worker["lat_col"], _worker["lon_col"])
+
+def enrich_file(input_path, output_path, boundary, table, lat_col="lat", lon_col="long", chunk_size=CHUNK_SIZE, workers=1):
+    """
+    Enrich every site of input_path into output_path (CSV or Parquet, from the extension), returning the row count.
+    - boundary/table: ward polygons (EPSG:4326) and their figures, e.g. from load_ward_table
+    - workers > 1 enriches the chunks in that many processes
+    """
+    writer = ChunkWriter(output_path)
+    try:
+        if workers == 1:
+            _init_worker(boundary, table, lat_col, lon_col)
+            for sites in read_chunks(input_path, chunk_size):
+                writer.write(_enrich_chunk(sites))
+            return writer.rows
+        workers = workers or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(boundary, table, lat_col, lon_col)) as executor:
+            in_flight = deque()
+            for sites in read_chunks(input_path, chunk_size):
+                in_flight.append(executor.submit(_enrich_chunk, sites))
+                # Bounded queue: wait for the oldest chunk before reading more
+                if len(in_flight) >= 2 * workers:
+                    writer.write(in_flight.popleft().result())
+            while in_flight:
+                writer.write(in_flight.popleft().result())
+        return writer.rows
+    finally:
+        writer.close()
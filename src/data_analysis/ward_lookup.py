@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import shapely
+
+"""
+Point-in-ward lookup, built once per boundary set:
+- an STRtree over the ward polygons resolves a (lon, lat) click to its ward
+- hash indexes from ward_id to population and stores replace full scans of these tables
+"""
+
+class WardLookup:
+    def __init__(self, boundary, df_population=None, df_stores=None):
+        self.boundary = boundary.reset_index(drop=True)
+        self.tree = shapely.STRtree(self.boundary.geometry.values)
+        self.ward_ids = self.boundary["ward_id"].to_numpy()
+        # ward_id -> population row
+        self.population = None
+        if df_population is not None:
+            self.population = df_population.drop_duplicates("ward_id").set_index("ward_id")
+        # ward_id -> positions of its stores
+        self.stores = df_stores
+        self.store_positions = {}
+        if df_stores is not None:
+            self.stores = df_stores.reset_index(drop=True)
+            self.store_positions = self.stores.groupby("ward_id").indices
+
+    def locate_many(self, lons, lats):
+        # Position in `boundary` of the ward containing each point, -1 if none
+        points = shapely.points(np.asarray(lons, dtype=float), np.asarray(lats, dtype=float))
+        point_idx, ward_idx = self.tree.query(points, predicate="within")
+        positions = np.full(len(points), -1, dtype=np.int64)
+        # Keep the first ward (in boundary order) for points matching several wards
+        order = np.lexsort((ward_idx, point_idx))
+        point_idx, ward_idx = point_idx[order], ward_idx[order]
+        first = np.unique(point_idx, return_index=True)[1]
+        positions[point_idx[first]] = ward_idx[first]
+        return positions
+
+    def ward_ids_at(self, lons, lats):
+        positions = self.locate_many(lons, lats)
+        return pd.Series(np.where(positions >= 0, self.ward_ids[positions], None), dtype=object)
+
+    def locate(self, lon, lat):
+        # Ward row containing the point, None if the point is outside every ward
+        position = self.locate_many([lon], [lat])[0]
+        return self.boundary.iloc[position] if position >= 0 else None
+
+    def population_of(self, ward_id, col="total"):
+        if self.population is None or ward_id not in self.population.index:
+            return 0
+        return self.population.at[ward_id, col]
+
+    def stores_in(self, ward_id):
+        positions = self.store_positions.get(ward_id, [])
+        return self.stores.iloc[positions] if self.stores is not None else pd.DataFrame()
@@ -0,0 +1,88 @@
+import re
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from unidecode import unidecode
+
+"""
+Shared engine to build the administrative matching keys (city/district/ward, *_org and *_en)
+for every data_quality module.
+The same few thousand ward names repeat over and over across datasets, so every transformation
+is computed once per distinct raw name and then broadcast back to the whole column.
+"""
+
+# Administrative titles as they are written in the source datasets
+TITLES_WITHSPACE = ("thành phố","thị xã","thị trấn")
+TITLES_WITHDOT = ("tp.","t.","q.","tx.","h.","p.","tt.","x.")
+TITLES_NODOT = ("thànhphố","tỉnh","quận","thịxã","huyện","phường","thịtrấn","xã")
+# Abbreviated or lowercase titles to their full form
+TITLES_FULL = {"tp":"ThànhPhố","t":"Tỉnh","q":"Quận","h":"Huyện","tx":"ThịXã","p":"Phường","tt":"ThịTrấn","x":"Xã",
+               "thànhphố":"ThànhPhố","tỉnh":"Tỉnh","quận":"Quận","huyện":"Huyện","thịxã":"ThịXã","phường":"Phường",
+               "thịtrấn":"ThịTrấn","xã":"Xã"}
+
+# A space goes before every uppercase letter and before every run of digits
+_WORD_START = re.compile(r"[0-9]+|[^\W\d_]")
+
+def map_unique(series, func):
+    # Apply a scalar transformation once per distinct value and broadcast it back to the column
+    codes, uniques = pd.factorize(series)
+    # Missing values are coded -1, which picks the trailing NaN
+    values = pd.Series([func(x) for x in uniques] + [np.nan])
+    return pd.Series(values.values[codes], index=series.index)
+
+def _space_before(match):
+    s = match.group()
+    return " " + s if "0" <= s[0] <= "9" or s.isupper() else s
+
+@lru_cache(maxsize=None)
+def insert_space(word):
+    # e.g. "ThịXãBuônHồ" -> "Thị Xã Buôn Hồ", "Phường12" -> "Phường 12"
+    return _WORD_START.sub(_space_before, word)[1:]
+
+@lru_cache(maxsize=None)
+def to_en(name):
+    # Remove all diacritics
+    return unidecode(name).lower()
+
+@lru_cache(maxsize=None)
+def split_title(name):
+    # Split a raw name into (title, name without title and spaces), e.g. "Q. Hai Bà Trưng" -> ("q", "HaiBàTrưng")
+    if name.lower().startswith(TITLES_WITHDOT):
+        title, _, notitle = name.strip().partition(".")
+        return title.lower(), notitle.replace(".","").replace(" ","")
+    if name.lower().startswith(TITLES_NODOT):
+        title, _, notitle = name.strip().partition(" ")
+        return title.lower(), notitle.replace(" ","")
+    return "", name.replace(" ","")
+
+def is_short_upper(name):
+    # Latin numbers like phườngIV
+    return name.upper()==name and len(name) < 4
+
+def remove_titles(series, titles):
+    # Remove every occurrence of the given titles, in order
+    def remove(name):
+        for t in titles:
+            name = name.replace(t,"")
+        return name
+    return map_unique(series, remove)
+
+def title_numbers(series, title):
+    # Some districts/wards just have title&number, thus need to insert their title back (e.g. "Quận1")
+    return map_unique(series, lambda x: title+str(int(x)) if x.isnumeric() else x)
+
+def title_short_upper(series, title):
+    return map_unique(series, lambda x: title+x if is_short_upper(x) else x)
+
+def revert_duplicates(df, keys, id_col, col):
+    # After transformation, some districts/wards are duplicated, thus need to revert them back to their original names
+    dup = df.groupby(keys)[id_col].transform('nunique').gt(1)
+    df.loc[dup,col] = df.loc[dup,col+"_org"].str.replace(" ","")
+    return df
+
+def add_en_keys(df, cols, names=None):
+    # Buffer matching keys by removing all diacritics
+    names = names or [col+"_en" for col in cols]
+    for col, name in zip(cols, names):
+        df[name] = map_unique(df[col], to_en)
+    return df
@@ -1,145 +1,216 @@
+import os
+import numpy as np
 import pandas as pd
 import geopandas as gpd
-from unidecode import unidecode
 import json
+from functools import lru_cache
+try:
+    import ijson
+except ImportError:
+    ijson = None
+from src.utils import artifact_cache, excel_mirror
+from src.utils.instrument import instrumented, annotate, match_rate
+from src.data_quality import admin_keys, vn_boundaries, ward_crosswalk
+from src.data_quality.vn_boundaries import exec as boundaries
+from src.data_quality.admin_keys import (TITLES_WITHSPACE, TITLES_FULL, map_unique, insert_space, to_en,
+                                         split_title, is_short_upper)
 
+WCM_PATH = r"data\Winmart location.xlsx"
+BHX_PATH = r"data\BHX_Stores.xlsx"
+BHX_ADMIN_PATH = r"data\BHX_IdbLocationCommon.json"
+# Any change in these files (or in the boundaries) invalidates the cached store locations
+ADMIN_SOURCES = [BHX_ADMIN_PATH, __file__, admin_keys.__file__]
+SOURCES = [WCM_PATH, BHX_PATH, BHX_ADMIN_PATH, __file__, admin_keys.__file__] + vn_boundaries.SOURCES + ward_crosswalk.SOURCES
+# Ward names of Winmart stores that are outdated (GADM's boundaries only reflect the administrative units before 2020)
+# or wrong, by STORE_ID. Only used for the stores without coordinates, which are located by their names.
+WARD_OVERRIDES = {
+    "5549": "VĩnhLạc", #instead of VĩnhBảo
+    "3355": "BìnhTrịĐôngB", #instead of BìnhTrịĐông
+    "4939": "TânMai", #instead of TamHiệp
+    "6398": "QuyếtTiến", "6491": "QuyếtTiến", #instead of ĐoànKết
+    "3161": "PhụngCông", "3160": "PhụngCông", "3572": "PhụngCông", #instead of XuânQuan
+    # Nghị quyết 130/NQ-CP: Thành lập các phường 1, 2, 3, 4, 5 thuộc thị xã Cai Lậy trên cơ sở giải thể thị trấn Cai Lậy
+    "6411": "Phường1", #instead of CaiLậy
+    # Nghị định 156/2003/NĐ-CP: điều chỉnh 24 ha diện tích tự nhiên và 1.211 người của phường Phú Thọ về phường Phú Hòa quản lý
+    "6693": "PhúHòa", #instead of PhúThọ
+    "3104": "XuânTảo", #instead of XuânĐỉnh
+    # Vincom Mega Mall Ocean Park, Vincom Plaza Long Biên, Khu đô thị Việt Hưng: wrong ward
+    "1699": "KiêuKỵ", #instead of TrâuQuỳ
+    "1541": "PhúcLợi", #instead of ViệtHưng
+    "3182": "ViệtHưng", #instead of GiangBiên
+}
+# Stores of the last refresh whose coordinates and ward names disagree, to check by hand (next to density's fuzzy matches)
+REVIEW_DIR = os.path.join(artifact_cache.CACHE_DIR, "review")
+
+def _provinces(json_filepath):
+    # Provinces of the location file, streamed one at a time when ijson is installed (see requirements.txt),
+    # otherwise the whole file is loaded at once
+    annotate(json_parser="json" if ijson is None else "ijson")
+    with open(json_filepath, "rb") as f:
+        if ijson is None:
+            for location in json.load(f)['fullDataLocation']:
+                yield from location['provinceList']
+        else:
+            yield from ijson.items(f, "fullDataLocation.item.provinceList.item", use_float=True)
+
+@instrumented()
 def flatten_adminDB(json_filepath):
     """
-    # Flatten nested store location data into a list of store dictionaries.
+    # Flatten nested store location data into a table of wards, one row per wardId sorted by wardId.
     """
-    # Get json file content
-    with open(json_filepath, encoding="utf8") as f:
-        json_data = json.load(f)
-    
-    flattened_wards = []
-    # Traverse the nested structure
-    for location in json_data['fullDataLocation']:
-        for province in location['provinceList']:
-            province_name = province['name']
-            provinceId = province['id']
-
-            for district in province['districtBOList']:
-                district_name = district['name'].split("(")[0] if "(" in district['name'] else district['name']
-                districtId = district['id']
-                
-                for ward in district['wards']:
-                    ward_name = ward['name'].split("(")[0] if "(" in ward['name'] else ward['name']
-                    wardId = ward['id']
-                            
-                    # Create flattened administrative dictionary
-                    flattened_ward = {
-                        'provinceId': provinceId,
-                        'city': province_name.replace(',', ';'),
-                        'districtId': districtId,
-                        'district': district_name.replace(',', ';'),
-                        'wardId': wardId,
-                        'ward': ward_name.replace(',', ';')
-                    }
-                    flattened_wards.append(flattened_ward)
-    
-    # Sort by storeId and remove duplicates
-    flattened_wards.sort(key=lambda x: x['wardId'])
-    # Remove duplicates while preserving order
+    columns = {col: [] for col in ["provinceId","city","districtId","district","wardId","ward"]}
     seen_ward_ids = set()
-    unique_wards = []
-    for ward in flattened_wards:
-        if ward['wardId'] not in seen_ward_ids:
-            seen_ward_ids.add(ward['wardId'])
-            unique_wards.append(ward)
-
-    return pd.DataFrame.from_dict(unique_wards)
-
-def insert_space(word):
-    result = ""
-    num = "0123456789"
-    # Iterate through each character in the word
-    for i in word:
-        # Check if the character is uppercase
-        if i.isupper():
-            # Concatenate a space and the uppercase version of the character to the result
-            result = result + " " + i.upper()
-        # Check if the character is number
-        elif i in num:
-            # Concatenate the character to the result if the previous character was also a number
-            if result[-1] in num:
-                result = result + i
-            # Concatenate a space only if the previous character was not a number
-            else:
-                result = result + " " + i
-        else:
-            # Concatenate the character to the result
-            result = result + i
-    # Remove the leading space from the result and return
-    return result[1:]
+    # Traverse the nested structure, keeping the first occurrence of every ward
+    for province in _provinces(json_filepath):
+        for district in province['districtBOList']:
+            for ward in district['wards']:
+                if ward['id'] in seen_ward_ids:
+                    continue
+                seen_ward_ids.add(ward['id'])
+                columns['provinceId'].append(province['id'])
+                columns['city'].append(province['name'])
+                columns['districtId'].append(district['id'])
+                columns['district'].append(district['name'])
+                columns['wardId'].append(ward['id'])
+                columns['ward'].append(ward['name'])
+
+    df = pd.DataFrame({col: np.asarray(columns[col], dtype=np.int64) if col.endswith("Id") else
+                            # Drop the former names in brackets, e.g. "Phường An Khánh (Q2)"
+                            map_unique(pd.Series(columns[col], dtype=object), lambda x: x.split("(")[0].replace(',', ';'))
+                       for col in columns})
+    return df.sort_values("wardId", kind="stable").reset_index(drop=True)
+
+def build_admin():
+    bhx_admin_list = flatten_adminDB(BHX_ADMIN_PATH)
+    return {"admin": adminkeys_to_match(bhx_admin_list, cols_to_fix=["city","district","ward"])}
+
+def bhx_admin():
+    # Normalized BHX administrative table, only parsed again when the JSON file changes
+    return artifact_cache.fetch("bhx_admin", inputs=ADMIN_SOURCES, build=build_admin, names=["admin"])["admin"]
+
+@lru_cache(maxsize=None)
+def admin_key(name, col):
+    # Unify administrative titles by removing their spaces
+    if name.lower().startswith(TITLES_WITHSPACE):
+        name = name.replace(" ","",1)
+    # Remove all administrative titles
+    title, notitle = split_title(name)
+    # Some district/ward just has title & (latin)number, or just number, thus need to insert the title "Quận"/"Phường" back
+    numbered = notitle.isnumeric() or is_short_upper(notitle) ##phườngIV
+    if col=="district":
+        key = "Quận"+notitle if notitle.isnumeric() else notitle
+    elif col=="ward":
+        key = "Phường"+notitle if numbered else notitle
+    else:
+        key = notitle
+    # Buffer matching keys by creating original administrative names
+    org = "" if numbered and title!="" else title
+    org = insert_space(TITLES_FULL.get(org, org) + key)
+    return key, org
 
 def adminkeys_to_match(df, cols_to_fix):
     # Create matching keys between datasets by transforming administrative names
     for col in cols_to_fix:
-        # Unify administrative titles by removing their spaces
-        titles_withspace = ["thành phố","thị xã","thị trấn"]
-        df[col] = df[col].apply(lambda x: x.replace(" ","",1) if x.lower().startswith(tuple(titles_withspace)) else x)
-        for index, row in df.iterrows():
-            titles_withdot = ["tp.","t.","q.","tx.","h.","p.","tt.","x."]
-            titles_nodot = ["thànhphố","tỉnh","quận","thịxã","huyện","phường","thịtrấn","xã"]
-            # Remove all administrative titles
-            if row[col].lower().startswith(tuple(titles_withdot)):
-                notitle = "".join(row[col].strip().split(".")[1:]).replace(" ","")
-                title = "".join(row[col].strip().split(".")[0]).lower()
-            elif row[col].lower().startswith(tuple(titles_nodot)):
-                notitle = "".join(row[col].strip().split(" ")[1:]).replace(" ","")
-                title = "".join(row[col].strip().split(" ")[0]).lower()
-            else:
-                notitle = row[col].replace(" ","")
-                title = ""
-            # Some district/ward just has title & (latin)number, or just number, thus need to insert the title "Quận"/"Phường" back
-            if col=="district":
-                df.loc[index, col] = "Quận"+notitle if notitle.isnumeric() else notitle
-            elif col=="ward":
-                df.loc[index, col] = "Phường"+notitle if notitle.isnumeric() else ("Phường"+notitle if notitle.upper()==notitle and len(notitle) < 4 else notitle) ##phườngIV
-            else:
-                df.loc[index, col] = notitle
-        # Buffer matching keys by creating original administrative names
-            df.loc[index, col+"_org"] = "" if notitle.isnumeric() and title!="" else ("" if notitle.upper()==notitle and len(notitle) < 4 and title!="" else title)
-        df[col+"_org"] = df[col+"_org"].replace({"tp":"ThànhPhố","t":"Tỉnh","q":"Quận","h":"Huyện","tx":"ThịXã","p":"Phường","tt":"ThịTrấn","x":"Xã",
-                                                 "thànhphố":"ThànhPhố","tỉnh":"Tỉnh","quận":"Quận","huyện":"Huyện","thịxã":"ThịXã","phường":"Phường",
-                                                  "thịtrấn":"ThịTrấn","xã":"Xã"})
-        df[col+"_org"] = df[col+"_org"] + df[col]
-        df[col+"_org"] = df[col+"_org"].apply(insert_space)
+        raw = df[col]
+        df[col] = map_unique(raw, lambda x: admin_key(x, col)[0])
+        df[col+"_org"] = map_unique(raw, lambda x: admin_key(x, col)[1])
         # Buffer matching keys by removing all diacritics
-        df[col+"_en"] = df[col].apply(lambda x: unidecode(x).lower())
+        df[col+"_en"] = map_unique(df[col], to_en)
     return df
 
-def exec(brand):
+def rebase_names(stores):
+    # Diacritic-free names of the stores re-based from the wards of 10-11-2024 to those of 1-1-2019 (GADM's) by the
+    # ward change record, the stores' own names where the record doesn't know their ward
+    rebased = ward_crosswalk.rebase(stores, cols=("city","district","ward"), reference=ward_crosswalk.SNAPSHOTS["old"])
+    keys = stores[["city_en","district_en","ward_en"]].copy()
+    found = rebased["crosswalk"].to_numpy(dtype=bool)
+    for col in ["city","district","ward"]:
+        keys.loc[found, col+"_en"] = map_unique(rebased.loc[found, col+"_ref"], lambda x: to_en(admin_key(x, col)[0]))
+    return keys
+
+def match_ward_names(stores, boundary):
+    # Fallback: match the diacritic-free administrative names of the stores to the boundaries
+    boundary_keys = pd.DataFrame({"city_en": map_unique(boundary["city"], to_en),
+                                  "district_en": boundary["dist_en"],
+                                  "ward_en": boundary["ward_en"],
+                                  "ward_id": boundary["ward_id"],
+                                  "dist_id": boundary["dist_id"]})
+    boundary_keys = boundary_keys.drop_duplicates(["city_en","district_en","ward_en"])
+    def lookup(keys):
+        matched = pd.merge(keys, boundary_keys, how="left", on=["city_en","district_en","ward_en"])
+        matched.index = stores.index
+        return matched[["ward_id","dist_id"]]
+    # Wards renamed, merged or split since 2019 are matched by their 2019 names first, then by their own names
+    own, rebased = lookup(stores[["city_en","district_en","ward_en"]]), lookup(rebase_names(stores))
+    use_own = rebased["ward_id"].isna()
+    rebased.loc[use_own] = own.loc[use_own]
+    annotate(rebased_wards=int((~use_own & (rebased["ward_id"]!=own["ward_id"].fillna(""))).sum()))
+    return rebased
+
+def override_wards(stores, lon_col, lat_col):
+    # Fixed ward names of the stores that can't be located by their coordinates (see WARD_OVERRIDES)
+    ward = stores["STORE_ID"].astype(str).map(WARD_OVERRIDES)
+    patch = (stores[lon_col].isna() | stores[lat_col].isna()) & ward.notna()
+    stores.loc[patch, "ward"] = ward[patch]
+    annotate(ward_overrides=int(patch.sum()))
+    return stores
+
+@instrumented()
+def assign_wards(stores, boundary, lon_col, lat_col):
+    """
+    Assign ward_id/dist_id to every store from its coordinates, in one indexed spatial join.
+    Stores without coordinates, or outside every ward, fall back to their administrative names.
+    The ward found from the names is kept in `ward_id_name` to report disagreements.
+    """
+    stores = stores.reset_index(drop=True)
+    points = gpd.GeoDataFrame(stores[[lon_col, lat_col]],
+                              geometry=gpd.points_from_xy(stores[lon_col], stores[lat_col]), crs=4326)
+    located = gpd.sjoin(points, boundary[["ward_id","dist_id","geometry"]].to_crs(4326), how="left", predicate="within")
+    # Points on a shared border fall in several wards, keep the first one
+    located = located[~located.index.duplicated(keep="first")]
+    by_name = match_ward_names(stores, boundary)
+
+    found = located["ward_id"].notna()
+    stores["ward_id"] = located["ward_id"].where(found, by_name["ward_id"])
+    stores["dist_id"] = located["dist_id"].where(found, by_name["dist_id"])
+    stores["ward_id_name"] = by_name["ward_id"]
+    stores["ward_match"] = np.where(found, "location", np.where(by_name["ward_id"].notna(), "name", None))
+    annotate(match_rate=match_rate(stores["ward_id"]), hits=stores["ward_match"].value_counts(dropna=False).to_dict())
+    return stores
+
+def ward_mismatches(stores):
+    # Stores whose coordinates and administrative names point to different wards
+    disagree = (stores["ward_match"]=="location") & stores["ward_id_name"].notna() & (stores["ward_id"]!=stores["ward_id_name"])
+    return stores[disagree]
+
+def save_mismatches(stores, brand):
+    mismatches = ward_mismatches(stores)
+    annotate(**{f"ward_mismatches_{brand}": len(mismatches)})
+    os.makedirs(REVIEW_DIR, exist_ok=True)
+    mismatches.to_csv(os.path.join(REVIEW_DIR, f"stores_{brand}.csv"), encoding="utf-8-sig")
+
+@instrumented()
+def build():
+    ward_boundaries = boundaries(admin_level="ward")
     # WCM store location
-    wcm_stores = pd.read_excel(r"data\Winmart location.xlsx")
-    # Some wards have changed names multiple times, while the GADM's boundaries only reflect admistratives before 2020
-    wcm_stores.loc[wcm_stores[wcm_stores.STORE_ID=="5549"].index, "ward"] = "VĩnhLạc" #instead of VĩnhBảo
-    wcm_stores.loc[wcm_stores[wcm_stores.STORE_ID=="3355"].index, "ward"] = "BìnhTrịĐôngB" #instead of BìnhTrịĐông
-    wcm_stores.loc[wcm_stores[wcm_stores.STORE_ID=="4939"].index, "ward"] = "TânMai" #instead of TamHiệp
-    wcm_stores.loc[wcm_stores[wcm_stores.STORE_ID.isin(["6398","6491"])].index, "ward"] = "QuyếtTiến" #instead of ĐoànKết
-    wcm_stores.loc[wcm_stores[wcm_stores.STORE_ID.isin(["3161","3160","3572"])].index, "ward"] = "PhụngCông" #instead of XuânQuan
-    # Nghị quyết 130/NQ-CP[4] điều chỉnh: Thành lập các phường 1, 2, 3, 4, 5 thuộc thị xã Cai Lậy trên cơ sở giải thể thị trấn Cai Lậy
-    # và điều chỉnh địa giới hành chính 2 xã Nhị Mỹ, Tân Bình
-    wcm_stores.loc[wcm_stores[wcm_stores.STORE_ID=="6411"].index, "ward"] = "Phường1" #instead of CaiLậy
-    # Nghị định 156/2003/NĐ-CP[5] điều chỉnh 24 ha diện tích tự nhiên và 1.211 người của phường Phú Thọ về phường Phú Hòa quản lý
-    wcm_stores.loc[wcm_stores[wcm_stores.STORE_ID=="6693"].index, "ward"] = "PhúHòa" #instead of PhúThọ
-    # Nghị định 156/2003/NĐ-CP[5] điều chỉnh 24 ha diện tích tự nhiên và 1.211 người của phường Phú Thọ về phường Phú Hòa quản lý
-    wcm_stores.loc[wcm_stores[wcm_stores.STORE_ID=="3104"].index, "ward"] = "XuânTảo" #instead of XuânĐỉnh
-    # Vincom Mega Mall Ocean Park: wrong ward
-    wcm_stores.loc[wcm_stores[wcm_stores.STORE_ID=="1699"].index, "ward"] = "KiêuKỵ" #instead of TrâuQuỳ
-    # Vincom Plaza Long Biên: wrong ward
-    wcm_stores.loc[wcm_stores[wcm_stores.STORE_ID=="1541"].index, "ward"] = "PhúcLợi" #instead of ViệtHưng
-    # Khu đô thị Việt Hưng: wrong ward
-    wcm_stores.loc[wcm_stores[wcm_stores.STORE_ID=="3182"].index, "ward"] = "ViệtHưng" #instead of GiangBiên
+    wcm_stores = excel_mirror.read_excel(WCM_PATH)
+    wcm_stores = override_wards(wcm_stores, lon_col="long", lat_col="lat")
     # Create matching keys
     wcm_stores = adminkeys_to_match(wcm_stores, cols_to_fix=["city","district","ward"])
+    # Wards are assigned from the store coordinates, which are more reliable than the (sometimes outdated) ward names
+    wcm_stores = assign_wards(wcm_stores, ward_boundaries, lon_col="long", lat_col="lat")
 
     # BHX store location
-    bhx_stores = pd.read_excel(r"data\BHX_Stores.xlsx")
+    bhx_stores = excel_mirror.read_excel(BHX_PATH)
     bhx_stores = bhx_stores[bhx_stores.columns[[0,1,8,11,18,3,6,7,15,14,13]]]
     # Add up administrative names
-    bhx_admin_list = flatten_adminDB(r"data\BHX_IdbLocationCommon.json")
-    bhx_admin_list = adminkeys_to_match(bhx_admin_list, cols_to_fix=["city","district","ward"])
-    bhx_stores = pd.merge(bhx_stores, bhx_admin_list, how="left", on=["provinceId","districtId","wardId"])
+    bhx_stores = pd.merge(bhx_stores, bhx_admin(), how="left", on=["provinceId","districtId","wardId"])
+    bhx_stores = assign_wards(bhx_stores, ward_boundaries, lon_col="lng", lat_col="lat")
 
-    return wcm_stores if brand=="Winmart" else bhx_stores
\ No newline at end of file
+    save_mismatches(wcm_stores, "Winmart")
+    save_mismatches(bhx_stores, "BHX")
+    return {"Winmart": wcm_stores, "BHX": bhx_stores}
+
+def exec(brand):
+    stores = artifact_cache.fetch("store_locations", inputs=SOURCES, build=build, names=["Winmart","BHX"])
+    return stores["Winmart"] if brand=="Winmart" else stores["BHX"]
\ No newline at end of file
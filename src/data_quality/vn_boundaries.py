@@ -1,6 +1,14 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 import geopandas as gpd
-from unidecode import unidecode
+import shapely
+from src.utils import artifact_cache
+from src.utils.instrument import instrumented
+from src.data_quality import admin_keys
+from src.data_quality.admin_keys import (map_unique, insert_space, remove_titles, title_numbers, revert_duplicates,
+                                         add_en_keys)
 
 """
 While analyzing all datasets, I found some issues in the boundaries provided by GADM:
@@ -12,28 +20,11 @@ I haven't found any source for other cities yet.
 For now, I'll replace the GADM's HCMC boundaries with CityScope's     
 """
 
-def insert_space(word):
-    result = ""
-    num = "0123456789"
-    # Iterate through each character in the word
-    for i in word:
-        # Check if the character is uppercase
-        if i.isupper():
-            # Concatenate a space and the uppercase version of the character to the result
-            result = result + " " + i.upper()
-        # Check if the character is number
-        elif i in num:
-            # Concatenate the character to the result if the previous character was also a number
-            if result[-1] in num:
-                result = result + i
-            # Concatenate a space only if the previous character was not a number
-            else:
-                result = result + " " + i
-        else:
-            # Concatenate the character to the result
-            result = result + i
-    # Remove the leading space from the result and return
-    return result[1:]
+GADM_PATH = r"data\gadm41_VNM_3.json"
+CITYSCOPE_PATH = r"data\CityScope_HCMC\Population_Ward_Level.shp"
+# Any change in these files invalidates the cached boundaries
+DIST_COLS = ["country","city","district","dist_id","city_org","district_org","dist_en"]
+SOURCES = [GADM_PATH, CITYSCOPE_PATH, CITYSCOPE_PATH.replace(".shp",".dbf"), __file__, admin_keys.__file__]
 
 def reverse_bracket(word):
     word_no_bracket = ""
@@ -46,43 +37,37 @@ def reverse_bracket(word):
 def fix_admin_names(df):
     for col in ["city","district","ward"]:
         # Tackle districts like CaoLãnh(Thànhphố) or wards like AnChâu(Thịtrấn)
-        df[col] = df[col].apply(lambda x: reverse_bracket(x).replace("Thànhphố","ThànhPhố").replace("Thịxã","ThịXã").replace("Thịtrấn","ThịTrấn"))
-        # Rename mispelling districts & wards
-        df["district"] = df["district"].apply(lambda x: x.replace("QuiNhơn","QuyNhơn").replace("TânThành","PhúMỹ"))
-        df["ward"] = df["ward"].replace({"ViệtKhái":"NguyễnViệtKhái","TrựcPhú":"NinhCường","ChươngDươngĐộ":"ChươngDương",
-                                       "PhiêngCôn":"PhiêngKôn","Trungtâmhuấnluyện":"TTHL","CưYang":"CưJang","Cầukho":"CầuKho"})
-        df.loc[df[df.ward_id=="VNM.39.1.15_1"].index, "ward"] = "ThanhPhú"
+        df[col] = map_unique(df[col], lambda x: reverse_bracket(x).replace("Thànhphố","ThànhPhố").replace("Thịxã","ThịXã").replace("Thịtrấn","ThịTrấn"))
+    # Rename mispelling districts & wards
+    df["district"] = map_unique(df["district"], lambda x: x.replace("QuiNhơn","QuyNhơn").replace("TânThành","PhúMỹ"))
+    df["ward"] = df["ward"].replace({"ViệtKhái":"NguyễnViệtKhái","TrựcPhú":"NinhCường","ChươngDươngĐộ":"ChươngDương",
+                                     "PhiêngCôn":"PhiêngKôn","Trungtâmhuấnluyện":"TTHL","CưYang":"CưJang","Cầukho":"CầuKho"})
+    df.loc[df[df.ward_id=="VNM.39.1.15_1"].index, "ward"] = "ThanhPhú"
     return df
 
 def adminkeys_to_match(df):
     # Original administrative names - To show on dashboard
     for col in ["city","district","ward"]:
-        df[col+"_org"] = df[col].apply(lambda x: insert_space(x))
+        df[col+"_org"] = map_unique(df[col], insert_space)
     
     # Split administrative names into names and titles (e.g. Thị Xã Buôn Hồ)
-    for i in range(len(df)):
-        for c in ["ThànhPhố","Tỉnh"]:
-            df.loc[i,"city"] = df.city[i].replace(c,"")
-        for d in ["ThànhPhố","Quận","ThịXã","Huyện"]:
-            df.loc[i,"district"] = df.district[i].replace(d,"")
-        for w in ["Huyện","Phường","Thị Trấn","Xã"]:
-            df.loc[i,"ward"] = df.ward[i].replace(w,"")
+    df["city"] = remove_titles(df["city"], ["ThànhPhố","Tỉnh"])
+    df["district"] = remove_titles(df["district"], ["ThànhPhố","Quận","ThịXã","Huyện"])
+    df["ward"] = remove_titles(df["ward"], ["Huyện","Phường","Thị Trấn","Xã"])
     
     # Some district just has title&number, thus need to insert the title "Quận" back to these districts
-    df["district"] = df["district"].apply(lambda x: "Quận"+str(int(x)) if x.isnumeric() else x)
+    df["district"] = title_numbers(df["district"], "Quận")
     # Some ward just has title&number, thus need to insert the title "Phường" back to these wards
-    df["ward"] = df["ward"].apply(lambda x: "Phường"+str(int(x)) if x.isnumeric() else x)
-    df.loc[df[df.dist_id=="VNM.24.7_1"].index, "ward"] = df[df.dist_id=="VNM.24.7_1"].ward.apply(lambda x: "Phường"+x if len(x) < 4 else x) ##phườngIV
+    df["ward"] = title_numbers(df["ward"], "Phường")
+    roman = df.dist_id=="VNM.24.7_1"
+    df.loc[roman, "ward"] = map_unique(df.loc[roman, "ward"], lambda x: "Phường"+x if len(x) < 4 else x) ##phườngIV
     
     # After transformation, some districts/wards are duplicated, thus need to revert them back to their original names
-    dup_dist = df.groupby(["city","district"])["dist_id"].transform('nunique').gt(1)
-    df.loc[dup_dist,"district"] = df.loc[dup_dist,"district_org"].apply(lambda x: x.replace(" ",""))
-    dup_ward = df.groupby(["city","district","ward"])["ward_id"].transform('nunique').gt(1)
-    df.loc[dup_ward,"ward"] = df.loc[dup_ward,"ward_org"].apply(lambda x: x.replace(" ",""))
+    df = revert_duplicates(df, ["city","district"], "dist_id", "district")
+    df = revert_duplicates(df, ["city","district","ward"], "ward_id", "ward")
     
     # Buffer matching keys by removing all diacritics
-    df["dist_en"] = df["district"].apply(lambda x: unidecode(x).lower())
-    df["ward_en"] = df["ward"].apply(lambda x: unidecode(x).lower())
+    df = add_en_keys(df, ["district","ward"], ["dist_en","ward_en"])
     return df
 
 def read_json(filepath, cols, newcols):
@@ -105,29 +90,52 @@ def read_shp(filepath, cols, newcols):
     df["ward_en"] = df["ward_en"].apply(lambda x: x.replace("Ward","Phuong").lower().replace(" ",""))
     return df
 
-def measure_area(df):
+def union_by(geoms, codes, n_groups):
+    # Union of the geometries of every group, groups run on several threads as shapely releases the GIL
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(n_groups + 1))
+    groups = [geoms[order[bounds[i]:bounds[i+1]]] for i in range(n_groups)]
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        return np.array(list(executor.map(shapely.union_all, groups)), dtype=object)
+
+def dissolve_level(df, keys):
+    # One row per group of `keys` with the union of its geometries, other columns take their first value
+    groups = df.groupby(keys, sort=True)
+    codes = groups.ngroup().to_numpy()
+    found = codes >= 0
+    level = groups.first().reset_index().drop(columns="geometry")
+    geometry = union_by(df.geometry.values[found], codes[found], len(level))
+    return gpd.GeoDataFrame(level, geometry=geometry, crs=df.crs)
+
+@instrumented()
+def build_hierarchy(ward_boundaries):
+    """
+    District and city shapes dissolved from the wards once, each level from the one below (ward -> district -> city).
+    Ward and district areas are measured together, in a single projection to the equal-area EPSG:6933.
+    Cities only keep their representative point, to center the map, in a small lookup table.
+    """
+    dist_boundaries = dissolve_level(ward_boundaries[DIST_COLS + ["geometry"]], DIST_COLS)
+    cities = dissolve_level(dist_boundaries[["city","city_org","geometry"]], ["city"])
     # convert CRS to equal-area projection -> the length unit is now `meter`
-    df = df.to_crs(epsg=6933)
-    df["area_sqm"] = df.area.values #/10e6 for sqKm
-    df = df.to_crs(epsg=4326)
-    return df
-
-def get_representative_loc(df, admin_level):
-    df_admin = df[[admin_level,"geometry"]].dissolve(by=admin_level, as_index=False)
-    df_admin["city_centroid"] = df_admin.representative_point()
-    df = pd.merge(df, df_admin[[admin_level,"city_centroid"]], how="inner", on=[admin_level])
-    return df
-
-def exec(admin_level):
+    geometry = gpd.GeoSeries(np.concatenate([ward_boundaries.geometry.values, dist_boundaries.geometry.values]), crs=ward_boundaries.crs)
+    area = geometry.to_crs(epsg=6933).area.values #/10e6 for sqKm
+    ward_boundaries["area_sqm"] = area[:len(ward_boundaries)]
+    dist_boundaries["area_sqm"] = area[len(ward_boundaries):]
+    points = cities.representative_point()
+    cities = pd.DataFrame({"city": cities["city"], "city_org": cities["city_org"], "lat": points.y, "long": points.x})
+    return ward_boundaries, dist_boundaries, cities
+
+@instrumented()
+def build():
     # Source: https://gadm.org/download_country.html (level 3 = Ward)
     # Note: GADM administrative names don't have spaces
-    gadm_boundaries = read_json(filepath=r"data\gadm41_VNM_3.json",
+    gadm_boundaries = read_json(filepath=GADM_PATH,
                                 cols=[2,4,7,6,9,0,16],
                                 newcols=["country","city","district","dist_id","ward","ward_id","geometry"],
                                 )
 
     # Source: https://github.com/CityScope/CSL_HCMC/tree/main/Data/GIS/Population/population_HCMC/population_shapefile
-    cityscope_boundaries = read_shp(filepath=r"data\CityScope_HCMC\Population_Ward_Level.shp",
+    cityscope_boundaries = read_shp(filepath=CITYSCOPE_PATH,
                                     cols=[0,1,2,11],
                                     newcols=["ward_en","dist_en","cityscope_id","geometry"]
                                     )
@@ -141,14 +149,15 @@ def exec(admin_level):
     ward_boundaries = pd.concat([gadm_boundaries[gadm_boundaries.city!="HồChíMinh"], hcmc_boundaries])
     ward_boundaries = gpd.GeoDataFrame(ward_boundaries.drop(["cityscope_id"], axis=1))
 
-    # Measure area size to later calculate population density
-    ward_boundaries = measure_area(ward_boundaries)
-    # Get city central point to navigate map easily
-    ward_boundaries = get_representative_loc(ward_boundaries, "city")
-    
-    dist_boundaries = ward_boundaries[[col for col in ward_boundaries.columns if "ward" not in col and "area" not in col]]
-    dist_boundaries = dist_boundaries.dissolve(by=["country","city","district","dist_id","city_org","district_org","dist_en"], as_index=False)
-    # Measure area size to later calculate population density
-    dist_boundaries = measure_area(dist_boundaries)
+    # Measure area size to later calculate population density, and get city central points to navigate map easily
+    ward_boundaries, dist_boundaries, cities = build_hierarchy(ward_boundaries)
 
-    return ward_boundaries if admin_level=="ward" else dist_boundaries
\ No newline at end of file
+    return {"ward": ward_boundaries, "district": dist_boundaries, "city": cities}
+
+def exec(admin_level):
+    """
+    Boundaries of the wards ("ward") or districts ("district"), or the representative point of every city ("city").
+    All levels are built (and cached) together, as districts and cities are dissolved from wards.
+    """
+    boundaries = artifact_cache.fetch("vn_boundaries", inputs=SOURCES, build=build, names=["ward","district","city"])
+    return boundaries[admin_level]
\ No newline at end of file
@@ -1,5 +1,9 @@
-import pandas as pd
-from unidecode import unidecode
+from functools import lru_cache
+from src.utils import artifact_cache, excel_mirror
+from src.utils.instrument import instrumented
+from src.data_quality import admin_keys
+from src.data_quality.admin_keys import (map_unique, remove_titles, title_numbers, title_short_upper, revert_duplicates,
+                                         add_en_keys)
 
 """
 Source of population data: http://portal.thongke.gov.vn/khodulieudanso2019/Default.aspx
@@ -7,8 +11,16 @@ Note: the administrative may not be updated as in 2019, for example, Thị xã 
 upgraded to a city in 10/2018 but the population data still keeps it as Thị xã Đồng Xoài
 """
 
-def read_excel_pivot(path, row_to_skip, row_header, cols_remove_agg, row_agg):
-    df = pd.read_excel(path, skiprows=row_to_skip, header=row_header)
+WORKBOOKS = {
+    "allpop": dict(path=r"data\Population data\Population by Urban (Ward).xlsx",
+                   row_to_skip=2, row_header=0, cols_remove_agg=[0,1], row_agg="Tổng số"),
+    "popage": dict(path=r"data\Population data\Population by Age & Urban (District).xlsx",
+                   row_to_skip=2, row_header=[0,1], cols_remove_agg=[0], row_agg="Tổng số"),
+    "household": dict(path=r"data\Population data\Population by Household Size (Ward).xlsx",
+                      row_to_skip=2, row_header=[0,1], cols_remove_agg=[0,1], row_agg="Tổng số"),
+}
+
+def clean_pivot(df, cols_remove_agg, row_agg):
     # Fill up empty Group by level rows
     cols=df.columns[[0,1]]
     df.loc[:,cols] = df.loc[:,cols].ffill()
@@ -18,6 +30,11 @@ def read_excel_pivot(path, row_to_skip, row_header, cols_remove_agg, row_agg):
     df.reset_index(drop=True, inplace=True)
     return df
 
+def read_excel_pivot(path, row_to_skip, row_header, cols_remove_agg, row_agg):
+    # The cleaned pivot is mirrored to Parquet, the workbook is only parsed again when it changes
+    return excel_mirror.read_excel(path, clean=clean_pivot, clean_kwargs=dict(cols_remove_agg=cols_remove_agg, row_agg=row_agg),
+                                   skiprows=row_to_skip, header=row_header)
+
 def fix_admin_names(df):
     df["city"] = df.city.apply(lambda x: x.replace("Thành phố","Thành Phố").replace('Thanh Hoá','Thanh Hóa').replace('Khánh Hoà','Khánh Hòa').replace("  "," ").strip())
     df["district"] = df.district.apply(lambda x: x.replace("Thành phố","Thành Phố").replace("Thị xã","Thị Xã").replace("  "," ").strip())
@@ -38,35 +55,28 @@ def fix_admin_names(df):
 def adminkeys_to_match(df, cols_to_fix):
     # Create matching keys between datasets by transforming administrative names
     for col in cols_to_fix:
-        df[col] = df[col].apply(lambda x: x.replace(" ",""))
-    for i in range(len(df)):
-        for c in ["ThànhPhố","Tỉnh"]:
-            df.loc[i,"city"] = df.city[i].replace(c,"")
-        for d in ["ThànhPhố","Quận","ThịXã","Huyện"]:
-            df.loc[i,"district"] = df.district[i].replace(d,"")
+        df[col] = map_unique(df[col], lambda x: x.replace(" ",""))
+    df["city"] = remove_titles(df["city"], ["ThànhPhố","Tỉnh"])
+    df["district"] = remove_titles(df["district"], ["ThànhPhố","Quận","ThịXã","Huyện"])
     # Buffer matching keys by removing all diacritics
-    df["dist_en"] = df["district"].apply(lambda x: unidecode(x).lower())
+    df = add_en_keys(df, ["district"], ["dist_en"])
     # Some district just has title&number, thus need to insert the title "Quận" back to these districts
-    df["district"] = df["district"].apply(lambda x: "Quận"+str(int(x)) if x.isnumeric() else x)
+    df["district"] = title_numbers(df["district"], "Quận")
     # After transformation, some districts/wards are duplicated, thus need to revert them back to their original names
-    dup_dist = df.groupby(["city","district"])["dist_id"].transform('nunique').gt(1)
-    df.loc[dup_dist,"district"] = df.loc[dup_dist,"district_org"].apply(lambda x: x.replace(" ",""))
+    df = revert_duplicates(df, ["city","district"], "dist_id", "district")
 
     if "ward" in cols_to_fix:
-        for i in range(len(df)):
-            for w in ["Huyện","Phường","ThịTrấn","Xã"]:
-                df.loc[i,"ward"] = df.ward[i].replace(w,"")
+        df["ward"] = remove_titles(df["ward"], ["Huyện","Phường","ThịTrấn","Xã"])
         # Buffer matching keys by removing all diacritics
-        df["ward_en"] = df["ward"].apply(lambda x: unidecode(x).lower())
+        df = add_en_keys(df, ["ward"], ["ward_en"])
         # Some ward just has title&number, thus need to insert the title "Phường" back to these wards
-        df["ward"] = df["ward"].apply(lambda x: "Phường"+str(int(x)) if x.isnumeric() else 
-                                               ("Phường"+x if x.upper()==x and len(x) < 4  ##phườngIV
-                                                else x))
-        dup_ward = df.groupby(["city","district","ward"])["ward_id"].transform('nunique').gt(1)
-        df.loc[dup_ward,"ward"] = df.loc[dup_ward,"ward_org"].apply(lambda x: x.replace(" ",""))
+        df["ward"] = title_numbers(df["ward"], "Phường")
+        df["ward"] = title_short_upper(df["ward"], "Phường") ##phườngIV
+        df = revert_duplicates(df, ["city","district","ward"], "ward_id", "ward")
         
     return df
 
+@instrumented()
 def transform_admin_data(df, cols, cols_to_fix):
     # Rename columns
     df.columns = cols
@@ -80,22 +90,25 @@ def transform_admin_data(df, cols, cols_to_fix):
     df = adminkeys_to_match(df, cols_to_fix)
     return df
 
-def exec(population_size):
+@lru_cache(maxsize=None)
+def read_workbook(name):
+    # Each census workbook is parsed at most once per process, whichever datasets use it
+    return read_excel_pivot(**WORKBOOKS[name])
+
+@instrumented()
+def build_allpop():
     # Population by Ward and Urban/Rural
-    df_allpop = read_excel_pivot(path=r"data\Population data\Population by Urban (Ward).xlsx",
-                                 row_to_skip=2, row_header=0,
-                                 cols_remove_agg=[0,1], row_agg="Tổng số"
-                                 )
+    df_allpop = read_workbook("allpop").copy()
     allpop_ward = transform_admin_data(df_allpop,
                                        cols=["city","district","ward","total","urban","rural"],
                                        cols_to_fix=["city","district","ward"]
                                        )
-    
+    return allpop_ward
+
+@instrumented()
+def build_youngpop():
     # Population by Age and Urban/Rural
-    df_popage = read_excel_pivot(path=r"data\Population data\Population by Age & Urban (District).xlsx",
-                                 row_to_skip=2, row_header=[0,1],
-                                 cols_remove_agg=[0], row_agg="Tổng số"
-                                 )
+    df_popage = read_workbook("popage").copy()
     df_popage["15-34_urban"] = df_popage['1. Thành thị'][df_popage['1. Thành thị'].columns[3:7]].sum(axis=1)
     df_popage["15-34_rural"] = df_popage['2. Nông thôn'][df_popage['2. Nông thôn'].columns[3:7]].sum(axis=1)
     df_popage["15-34_total"] = df_popage["15-34_urban"] + df_popage["15-34_rural"]
@@ -104,13 +117,12 @@ def exec(population_size):
                                          cols=["city","district","15-34_urban","15-34_rural","15-34_total"],
                                          cols_to_fix=["city","district"]
                                          )
-    
-    # Household number by Size and Urban/Rural
-    df_household = read_excel_pivot(path=r"data\Population data\Population by Household Size (Ward).xlsx",
-                                    row_to_skip=2, row_header=[0,1],
-                                    cols_remove_agg=[0,1], row_agg="Tổng số"
-                                    )
+    return youngpop_dist
 
+@instrumented()
+def build_household():
+    # Household number by Size and Urban/Rural
+    df_household = read_workbook("household").copy()
     df_household["5+_urban"] = df_household['1. Thành thị'][df_household['1. Thành thị'].columns[4:]].sum(axis=1)
     df_household["1-2_rural"] = df_household['2. Nông thôn'][df_household['2. Nông thôn'].columns[0:2]].sum(axis=1)
     df_household["5+_rural"] = df_household['2. Nông thôn'][df_household['2. Nông thôn'].columns[4:]].sum(axis=1)
@@ -120,5 +132,28 @@ def exec(population_size):
                                           cols=["city","district","ward","1_urban","2_urban","3_urban","4_urban","5+_urban","1-2_rural","3_rural","4_rural","5+_rural"],
                                           cols_to_fix=["city","district","ward"]
                                           )
-    
-    return allpop_ward if population_size=="all" else (youngpop_dist if population_size=="young" else household_ward)
\ No newline at end of file
+    return household_ward
+
+# population_size -> (workbook, builder)
+DATASETS = {"all": ("allpop", build_allpop),
+            "young": ("popage", build_youngpop),
+            "household": ("household", build_household)}
+
+@lru_cache(maxsize=None)
+def _load(population_size):
+    workbook, build = DATASETS[population_size]
+    # Any change in the workbook or in the transformation invalidates the cached dataset
+    inputs = [WORKBOOKS[workbook]["path"], __file__, admin_keys.__file__]
+    population = artifact_cache.fetch(f"vn_population_{population_size}", inputs=inputs,
+                                      build=lambda: {population_size: build()}, names=[population_size])
+    return population[population_size]
+
+def load(*population_sizes):
+    """
+    Return {population_size: DataFrame} for the requested datasets ("all", "young", "household").
+    Each dataset is only built when requested, and at most once per process.
+    """
+    return {population_size: _load(population_size).copy() for population_size in population_sizes}
+
+def exec(population_size):
+    return load(population_size)[population_size]
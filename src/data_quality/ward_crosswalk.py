@@ -0,0 +1,140 @@
+import re
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from src.utils import artifact_cache, excel_mirror
+from src.data_quality import admin_keys
+from src.data_quality.admin_keys import TITLES_WITHDOT, TITLES_NODOT, map_unique, to_en
+
+"""
+Crosswalk between the wards of 1-1-2019 (census, GADM) and of 10-11-2024 (store locations), from the GSO
+ward change record. Every row of the record links an old ward to a new ward: unchanged and renamed wards
+map 1-to-1, merged wards map many-to-1 and split wards 1-to-many.
+Split weights come from the area (km2) and population transferred, as written in the notes of the record
+(e.g. "Nhập 0,01 km2 diện tích tự nhiên, 642 người của phường Ngô Thì Nhậm vào phường Nguyễn Du"),
+falling back to an equal split when the notes do not give them.
+Re-basing a dataset is one join on the name keys of both snapshots followed by a weighted group-by.
+"""
+
+CHANGE_RECORD_PATH = r"data\Ward change record (1-1-2019 vs 10-11-2024)_modified.xls"
+SOURCES = [CHANGE_RECORD_PATH, __file__, admin_keys.__file__]
+# The two snapshots compared by the change record
+SNAPSHOTS = {"old": pd.Timestamp("2019-01-01"), "new": pd.Timestamp("2024-11-10")}
+LEVELS = ["city","district","ward"]
+RECORD_COLS = {"Tỉnh":"old_city_code", "Tên Tỉnh":"old_city", "QH":"old_district_code", "Tên QH":"old_district",
+               "Xã":"old_ward_code", "Tên Xã":"old_ward", "Tên Xã DC":"new_ward", "Xã DC":"new_ward_code",
+               "Tên QH DC":"new_district", "QH DC":"new_district_code", "Tên Tỉnh DC":"new_city",
+               "Tỉnh DC":"new_city_code", "Ghi Chú":"note"}
+
+# "<area> km2 diện tích tự nhiên, <population> người của <old ward> vào <new ward>"
+_TRANSFER = re.compile(r"([\d.,]+)\s*km2?\s*diện tích tự nhiên,?\s*([\d.]+)\s*người[^,;]*?\svào\s+([^,;]+?)(?=\s+và\s|[,;.]|$)",
+                       re.IGNORECASE)
+
+@lru_cache(maxsize=None)
+def name_key(name):
+    # Title-free, diacritic-free key of any spelling of a name, e.g. "P. Bùi Thị Xuân", "Phường Bùi Thị Xuân", "BùiThịXuân" -> "buithixuan"
+    name = name.strip()
+    if name.lower().startswith(TITLES_WITHDOT):
+        name = name.partition(".")[2]
+    name = name.replace(" ","")
+    for title in TITLES_NODOT:
+        if name.lower().startswith(title) and len(name) > len(title):
+            name = name[len(title):]
+            break
+    key = to_en(name)
+    return str(int(key)) if key.isnumeric() else key
+
+def parse_transfers(note):
+    # {new ward key: (area km2, population)} of the transfers described in a note
+    transfers = {}
+    for area, population, target in _TRANSFER.findall(note if isinstance(note, str) else ""):
+        transfers[name_key(target)] = (float(area.replace(".","").replace(",",".")), float(population.replace(".","")))
+    return transfers
+
+def split_weights(df, group, measure):
+    # Share of each row in its group by measure, NaN when the measure is not known for the whole group
+    total = df.groupby(group)[measure].transform("sum")
+    known = df[measure].notna().groupby([df[col] for col in group]).transform("all") & (total > 0)
+    return (df[measure] / total).where(known)
+
+def equal_weights(df, group):
+    return 1 / df.groupby(group)[group[0]].transform("size")
+
+def build():
+    record = excel_mirror.read_excel(CHANGE_RECORD_PATH).rename(columns=RECORD_COLS)
+    # Dissolved wards have no new ward
+    record = record.dropna(subset=["new_ward"]).reset_index(drop=True)
+    record["old_city_code"] = record["old_city_code"].fillna(record.groupby("old_city")["old_city_code"].transform("first"))
+    for side in ["old","new"]:
+        for level in LEVELS:
+            record[f"{side}_{level}_key"] = map_unique(record[f"{side}_{level}"], name_key)
+    old_ward = ["old_city_key","old_district_key","old_ward_key"]
+    new_ward = ["new_city_key","new_district_key","new_ward_key"]
+    # Spelling variants of the same ward (e.g. Tàm Xá/Tầm Xá) are the same link
+    record = record.drop_duplicates(old_ward + new_ward).reset_index(drop=True)
+
+    # Area & population moved from the old ward to the new ward, when the note gives them
+    transfers = map_unique(record["note"], parse_transfers)
+    moved = [t.get(key, (np.nan, np.nan)) if isinstance(t, dict) else (np.nan, np.nan)
+             for t, key in zip(transfers, record["new_ward_key"])]
+    record[["area_km2","population"]] = np.array(moved, dtype=float).reshape(-1, 2)
+    # Share of the old ward going to each new ward, by population, else by area, else equal
+    record["weight_to_new"] = (split_weights(record, old_ward, "population")
+                               .fillna(split_weights(record, old_ward, "area_km2"))
+                               .fillna(equal_weights(record, old_ward)))
+    # Share of the new ward coming from each old ward
+    record["weight_to_old"] = split_weights(record, new_ward, "population").fillna(equal_weights(record, new_ward))
+    return {"crosswalk": record}
+
+@lru_cache(maxsize=None)
+def _load():
+    return artifact_cache.fetch("ward_crosswalk", inputs=SOURCES, build=build, names=["crosswalk"])["crosswalk"]
+
+def exec():
+    return _load().copy()
+
+def direction(reference):
+    # Snapshot the data is re-based to, and the snapshot it comes from
+    # The record only knows the 2 snapshots: any date before 10-11-2024 resolves to the 2019 wards
+    target = "new" if pd.Timestamp(reference) >= SNAPSHOTS["new"] else "old"
+    return target, "old" if target=="new" else "new"
+
+def rebase(df, cols=("city","district","ward"), values=None, reference="2024-11-10"):
+    """
+    Re-base a dataset with city/district/ward names (any spelling, given by `cols`) to the wards in force at `reference`.
+    - values=None: every row gets the new ward receiving most of its old ward, in columns "<level>_ref" and "ward_code_ref"
+    - values=[columns]: additive columns (population, stores, ...) are split by the crosswalk weights and
+      summed by new ward, one row per new ward
+    Rows whose ward is not in the record are assumed unchanged. Column "crosswalk" tells whether the row was found.
+    """
+    target, source = direction(reference)
+    crosswalk = _load()
+    weight = "weight_to_new" if target=="new" else "weight_to_old"
+    source_keys = [f"{source}_{level}_key" for level in LEVELS]
+    target_cols = [f"{target}_{level}" for level in LEVELS] + [f"{target}_ward_code"]
+    keys = pd.DataFrame({key: map_unique(df[col], name_key) for key, col in zip(source_keys, cols)}, index=df.index)
+
+    if values is None:
+        # Main destination of every ward
+        crosswalk = crosswalk.sort_values(weight, ascending=False, kind="stable").drop_duplicates(source_keys)
+        matched = pd.merge(keys, crosswalk[source_keys + target_cols], how="left", on=source_keys)
+        matched.index = df.index
+        result = df.copy()
+        found = matched[target_cols[0]].notna()
+        for level, col in zip(LEVELS, cols):
+            result[f"{level}_ref"] = matched[f"{target}_{level}"].where(found, df[col])
+        result["ward_code_ref"] = matched[f"{target}_ward_code"]
+        result["crosswalk"] = found
+        return result
+
+    values = list(values)
+    rows = pd.concat([keys, df[list(cols) + values]], axis=1)
+    matched = pd.merge(rows, crosswalk[source_keys + target_cols + [weight]], how="left", on=source_keys)
+    found = matched[weight].notna()
+    matched[values] = matched[values].mul(matched[weight].fillna(1), axis=0)
+    for level, col in zip(LEVELS, cols):
+        matched[f"{level}_ref"] = matched[f"{target}_{level}"].where(found, matched[col])
+    matched["ward_code_ref"] = matched[f"{target}_ward_code"]
+    matched["crosswalk"] = found
+    group = [f"{level}_ref" for level in LEVELS] + ["ward_code_ref","crosswalk"]
+    return matched.groupby(group, dropna=False, sort=False)[values].sum().reset_index()
@@ -0,0 +1,87 @@
+import os
+import glob
+import json
+import hashlib
+from functools import lru_cache
+import pandas as pd
+import geopandas as gpd
+from src.utils import instrument
+
+"""
+Persistent cache for the outputs of every pipeline stage (vn_boundaries, vn_population, store_locations, ...).
+Each artifact is stored as (Geo)Parquet under CACHE_DIR and keyed by a hash of
+- the content of every input file (source data and the code that transforms it)
+- the transform parameters
+so that editing a source file or the transformation invalidates the cache automatically.
+Set RETAIL_CACHE=0 to bypass the cache, or RETAIL_CACHE_DIR to move it.
+"""
+
+CACHE_DIR = os.environ.get("RETAIL_CACHE_DIR", os.path.join("data","cache"))
+CACHE_ENABLED = os.environ.get("RETAIL_CACHE", "1") != "0"
+
+@lru_cache(maxsize=None)
+def _hash_content(path, size, mtime_ns):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def file_hash(path):
+    # Content hash of a file, only recomputed when its size or modification time changes
+    stat = os.stat(path)
+    return _hash_content(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+def cache_key(stage, inputs, params=None):
+    payload = {"stage": stage,
+               "inputs": [file_hash(path) for path in inputs],
+               "params": params or {}}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf8")).hexdigest()[:16]
+
+def _artifact_path(stage, key, name):
+    return os.path.join(CACHE_DIR, f"{stage}-{key}-{name}.parquet")
+
+def load(stage, key, names):
+    paths = [_artifact_path(stage, key, name) for name in names]
+    if not all(os.path.exists(path) for path in paths):
+        return None
+    artifacts = {}
+    for name, path in zip(names, paths):
+        try:
+            artifacts[name] = gpd.read_parquet(path)
+        except ValueError:
+            # Not a GeoParquet file
+            artifacts[name] = pd.read_parquet(path)
+    return artifacts
+
+def save(stage, key, artifacts):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Remove artifacts of older versions of this stage
+    for path in glob.glob(os.path.join(CACHE_DIR, f"{stage}-*.parquet")):
+        if not os.path.basename(path).startswith(f"{stage}-{key}-"):
+            os.remove(path)
+    for name, df in artifacts.items():
+        path = _artifact_path(stage, key, name)
+        # Write then rename, so that a concurrent reader never sees a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+def fetch(stage, inputs, build, names, params=None):
+    """
+    Return the artifacts `names` of a stage, building (and caching) them with `build` when
+    they are missing or outdated. `build` returns a dictionary {name: DataFrame/GeoDataFrame}.
+    """
+    with instrument.stage(stage) as event:
+        if not CACHE_ENABLED:
+            artifacts = build()
+            event["cache"] = "disabled"
+        else:
+            key = cache_key(stage, inputs, params)
+            artifacts = load(stage, key, names)
+            event["cache"] = "hit" if artifacts is not None else "miss"
+            if artifacts is None:
+                artifacts = build()
+                save(stage, key, artifacts)
+        event["rows_out"] = instrument.count_rows(artifacts)
+    return artifacts
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+"""
+Compact memory layout for the demographic and boundary frames.
+- GADM IDs ("VNM.39.1.15_1") become categoricals over a lookup table of all IDs: each row only holds a dense
+  integer code (the surrogate key), joins and group-bys between frames sharing the lookup run on these codes
+- repeated name columns (city, district, ward and their _org/_en variants) are dictionary-encoded as categoricals
+- counts are stored in the narrowest numeric dtype that holds them exactly
+"""
+
+ID_COLS = ["ward_id","dist_id"]
+# A text column is dictionary-encoded when it has fewer distinct values than this share of its rows
+CATEGORY_RATIO = 0.5
+
+class IdLookup:
+    def __init__(self, ids):
+        # Sorted distinct IDs, the surrogate key of an ID is its position
+        self.ids = pd.Index(pd.unique(pd.Series(ids).dropna())).sort_values()
+        self.dtype = pd.CategoricalDtype(self.ids)
+
+    @classmethod
+    def from_boundary(cls, boundary, col="ward_id"):
+        return cls(boundary[col])
+
+def shared_categories(frames, cols):
+    # One categorical dtype per column over the values of all frames, so that they join on the codes
+    return {col: pd.CategoricalDtype(pd.unique(pd.concat([df[col] for df in frames if col in df], ignore_index=True).dropna()))
+            for col in cols}
+
+def narrow_numeric(series):
+    # Narrowest integer dtype, or float32 when it's exact
+    if pd.api.types.is_integer_dtype(series) and not isinstance(series.dtype, pd.CategoricalDtype):
+        return pd.to_numeric(series, downcast="integer")
+    if pd.api.types.is_float_dtype(series):
+        narrow = series.astype(np.float32)
+        if np.array_equal(narrow.to_numpy(dtype=np.float64), series.to_numpy(dtype=np.float64), equal_nan=True):
+            return narrow
+    return series
+
+def compact(df, lookups=None, categories=None):
+    """
+    Compact copy of a (Geo)DataFrame.
+    - lookups: {id column: IdLookup}, IDs are encoded on the lookup so that all frames share the same keys
+    - categories: {column: CategoricalDtype}, e.g. from shared_categories, for the columns to join on
+    """
+    lookups, categories = lookups or {}, categories or {}
+    df = df.copy()
+    for col in df.columns:
+        if col == getattr(df, "_geometry_column_name", None):
+            continue
+        series = df[col]
+        if col in lookups:
+            df[col] = series.astype(lookups[col].dtype)
+        elif col in categories:
+            df[col] = series.astype(categories[col])
+        elif pd.api.types.is_string_dtype(series) or series.dtype == object:
+            if series.nunique() < CATEGORY_RATIO * len(series):
+                df[col] = series.astype("category")
+        else:
+            df[col] = narrow_numeric(series)
+    return df
+
+def restore(df):
+    # Plain dtypes back (categoricals to their values), for consumers that need them
+    df = df.copy()
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(df[col].cat.categories.dtype)
+    return df
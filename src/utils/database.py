@@ -0,0 +1,158 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
+import duckdb
+import pandas as pd
+import geopandas as gpd
+from src.utils import artifact_cache
+from src.utils.compact import restore
+
+"""
+Local DuckDB database holding the demographic, boundary and store tables, ready to be queried.
+- the tables are materialized once into a persistent .duckdb file, and only rebuilt when a source changes
+- boundaries keep their geometries as WKB, to be read with ST_GeomFromWKB once the spatial extension is loaded
+- the spatial extension is loaded lazily, from the local extension directory only (no network access)
+- the ward/district aggregate cube is exposed as views over its Parquet files (see cube.py)
+- read-only connections are pooled, so several dashboard sessions or workers can query at once
+"""
+
+DB_PATH = os.environ.get("RETAIL_DB_PATH", os.path.join("data","retail.duckdb"))
+# Optional local copy of the spatial extension, for machines without any installed extension
+SPATIAL_EXTENSION = os.environ.get("RETAIL_DUCKDB_SPATIAL")
+POOL_SIZE = int(os.environ.get("RETAIL_DB_POOL_SIZE", "4"))
+# Extensions are never installed or loaded behind our back (e.g. downloaded when reading a geometry), only by load_spatial
+DUCKDB_CONFIG = {"autoinstall_known_extensions": False, "autoload_known_extensions": False}
+
+# Table -> columns to index
+INDEXES = {"demographic_ward": ["ward_id"],
+           "demographic_dist": ["dist_id"],
+           "ward_boundaries": ["ward_id", "dist_id"],
+           "dist_boundaries": ["dist_id"],
+           "cities": ["city"],
+           "stores": ["ward_id", "dist_id"]}
+
+def load_spatial(con):
+    # Load the spatial extension if it's available locally, return whether it's loaded
+    try:
+        con.sql("LOAD spatial;")
+        return True
+    except duckdb.Error:
+        pass
+    if SPATIAL_EXTENSION and os.path.exists(SPATIAL_EXTENSION):
+        try:
+            con.sql(f"INSTALL '{SPATIAL_EXTENSION}'; LOAD spatial;")
+            return True
+        except duckdb.Error:
+            pass
+    return False
+
+def connect(path=DB_PATH, read_only=False):
+    return duckdb.connect(path, read_only=read_only, config=DUCKDB_CONFIG)
+
+def to_table(df):
+    # Geometries are stored as WKB
+    if isinstance(df, gpd.GeoDataFrame):
+        df = pd.DataFrame(df.to_wkb())
+    return df
+
+def source_tables():
+    # Imported here as building the tables runs the whole pipeline
+    from src.data_quality.vn_boundaries import exec as boundaries
+    from src.data_quality.store_locations import exec as stores
+    from src.data_analysis.density import exec as demographic
+    df_stores = pd.concat([stores("Winmart").assign(brand="Winmart"),
+                           stores("BHX").rename(columns={"storeId":"STORE_ID","storeName":"STORE_NAME","lng":"long"})
+                                        .assign(brand="BHX", STORE_ID=lambda df: df["STORE_ID"].astype(str))],
+                          ignore_index=True)
+    # Plain VARCHAR columns in the database rather than ENUMs of the compact layout
+    return {"demographic_ward": restore(demographic("ward")),
+            "demographic_dist": restore(demographic("district")),
+            "ward_boundaries": boundaries("ward"),
+            "dist_boundaries": boundaries("district"),
+            "cities": boundaries("city"),
+            "stores": df_stores}
+
+def sources_key():
+    # Every source file and module that feeds the tables: the boundaries, census workbooks and stores, and the
+    # matching (key_matcher) and layout (compact) code that sets their IDs
+    from src.data_quality import store_locations
+    from src.data_analysis.cube import demographic_sources
+    from src.utils import excel_mirror
+    inputs = demographic_sources() + store_locations.SOURCES + [excel_mirror.__file__, __file__]
+    return artifact_cache.cache_key("database", sorted(set(inputs)))
+
+def build_database(path=DB_PATH, force=False):
+    # Materialize and index all tables, unless the database is already up to date
+    key = sources_key()
+    if not force and os.path.exists(path):
+        with connect(path, read_only=True) as con:
+            try:
+                if con.sql("SELECT key FROM _metadata").fetchone()[0]==key:
+                    return path
+            except duckdb.Error:
+                pass
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with connect(path) as con:
+        load_spatial(con)
+        for name, df in source_tables().items():
+            table = to_table(df)
+            con.register("_df", table)
+            con.sql(f'CREATE OR REPLACE TABLE "{name}" AS SELECT * FROM _df')
+            con.unregister("_df")
+            for col in INDEXES.get(name, []):
+                con.sql(f'CREATE INDEX IF NOT EXISTS "{name}_{col}" ON "{name}" ("{col}")')
+        create_cube_views(con)
+        con.sql("CREATE OR REPLACE TABLE _metadata AS SELECT ? AS key", params=[key])
+    return path
+
+def create_cube_views(con):
+    # The cube is refreshed incrementally in Parquet, the views always read its latest files
+    from src.data_analysis import cube
+    cube.exec()
+    for name, path in cube.cube_paths().items():
+        path = os.path.abspath(path).replace("'", "''")
+        con.sql(f"CREATE OR REPLACE VIEW \"{name}\" AS SELECT * FROM read_parquet('{path}')")
+
+class ConnectionPool:
+    """
+    Pool of read-only connections to one database file.
+    All connections share the same database instance, each one can be used by one thread at a time.
+    """
+    def __init__(self, path=DB_PATH, size=POOL_SIZE, spatial=True):
+        self.path = path
+        self.database = connect(path, read_only=True)
+        self.spatial = load_spatial(self.database) if spatial else False
+        self.connections = queue.Queue()
+        for _ in range(size):
+            self.connections.put(self.database.cursor())
+
+    @contextmanager
+    def connection(self):
+        con = self.connections.get()
+        try:
+            yield con
+        finally:
+            self.connections.put(con)
+
+    def query(self, sql, params=None):
+        with self.connection() as con:
+            return con.execute(sql, params or []).df()
+
+    def close(self):
+        while not self.connections.empty():
+            self.connections.get().close()
+        self.database.close()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(path=DB_PATH):
+    # One pool per database file and process, opened on first use
+    with _pools_lock:
+        if path not in _pools:
+            _pools[path] = ConnectionPool(path)
+        return _pools[path]
+
+def query(sql, params=None, path=DB_PATH):
+    return get_pool(path).query(sql, params)
@@ -0,0 +1,74 @@
+import os
+import glob
+import inspect
+import hashlib
+import json
+import warnings
+import pandas as pd
+from src.utils.artifact_cache import CACHE_DIR, CACHE_ENABLED, file_hash
+
+"""
+Parquet mirror of the Excel inputs.
+Parsing .xlsx files is slow and single-threaded, so each (workbook, read options, clean-up) is converted once
+to Parquet under CACHE_DIR/excel, then read back in a fraction of the time. Multi-row headers are flattened
+in the Parquet file and restored as MultiIndex columns. The mirror is keyed by the content hash of the workbook
+and of the clean-up code, so editing either converts the workbook again.
+"""
+
+MIRROR_DIR = os.path.join(CACHE_DIR, "excel")
+# Joins the levels of multi-row headers into flat Parquet column names
+SEPARATOR = "\x1f"
+
+def flatten_columns(df):
+    if isinstance(df.columns, pd.MultiIndex):
+        df = df.copy()
+        df.columns = [SEPARATOR.join(str(level) for level in col) for col in df.columns]
+    return df
+
+def restore_columns(df):
+    if any(SEPARATOR in str(col) for col in df.columns):
+        df.columns = pd.MultiIndex.from_tuples([tuple(col.split(SEPARATOR)) for col in df.columns])
+    return df
+
+def _mirror_paths(path, read_kwargs, clean, clean_kwargs):
+    # One mirror per (workbook, options): "<workbook>-<options hash>-<content hash>.parquet"
+    options = {"read": read_kwargs, "clean": clean.__qualname__ if clean else None, "clean_kwargs": clean_kwargs}
+    options_key = hashlib.sha256(json.dumps(options, sort_keys=True, default=str).encode("utf8")).hexdigest()[:8]
+    inputs = [path] + ([inspect.getsourcefile(clean)] if clean else [])
+    content_key = hashlib.sha256("".join(file_hash(p) for p in inputs).encode("utf8")).hexdigest()[:16]
+    # Excel paths are Windows style, e.g. r"data\Winmart location.xlsx"
+    name = os.path.splitext(os.path.basename(path.replace("\\", "/")))[0]
+    prefix = os.path.join(MIRROR_DIR, f"{name}-{options_key}-")
+    return prefix, f"{prefix}{content_key}.parquet"
+
+def read_excel(path, clean=None, clean_kwargs=None, **read_kwargs):
+    """
+    pd.read_excel(path, **read_kwargs), followed by clean(df, **clean_kwargs) if given, served from the mirror when up to date.
+    """
+    clean_kwargs = clean_kwargs or {}
+    def convert():
+        df = pd.read_excel(path, **read_kwargs)
+        return clean(df, **clean_kwargs) if clean else df
+    if not CACHE_ENABLED:
+        return convert()
+
+    prefix, mirror_path = _mirror_paths(path, read_kwargs, clean, clean_kwargs)
+    if os.path.exists(mirror_path):
+        return restore_columns(pd.read_parquet(mirror_path, memory_map=True))
+    df = convert()
+    os.makedirs(MIRROR_DIR, exist_ok=True)
+    # Write then rename, so that a concurrent reader never sees a partial file
+    tmp_path = f"{mirror_path}.{os.getpid()}.tmp"
+    try:
+        flatten_columns(df).to_parquet(tmp_path, index=False)
+    except (ValueError, TypeError) as e:
+        # e.g. a column mixing numbers and text, which Parquet cannot type: keep reading the workbook
+        warnings.warn(f"{path} is not mirrored: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return df
+    # Remove mirrors of older versions of the workbook
+    for old_path in glob.glob(f"{glob.escape(prefix)}*.parquet"):
+        os.remove(old_path)
+    os.replace(tmp_path, mirror_path)
+    return df
@@ -0,0 +1,129 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import functools
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import pandas as pd
+
+"""
+Instrumentation of the pipeline stages.
+Every stage emits one JSON event with its wall time, the peak RSS of the process so far and how much the stage
+raised it, rows in/out and any stage-specific fields (e.g. key-match rates per tier):
+    {"stage": "density.set_wardID", "seconds": 0.41, "process_peak_rss_mb": 812.5, "peak_rss_growth_mb": 35.2,
+     "rows_in": 10611, "rows_out": 10611, "match_rate": 0.998, "hits": {"exact": 10230, ...}, "parent": "density.exec", ...}
+The process peak never goes down: a stage whose growth is 0 stayed under the peak of an earlier stage.
+Events are kept in EVENTS and, with RETAIL_EVENTS set, appended as JSON lines to that file ("-" for stderr).
+Set RETAIL_PROFILE to a stage name to dump a cProfile of that stage under RETAIL_PROFILE_DIR.
+"""
+
+EVENTS_PATH = os.environ.get("RETAIL_EVENTS")
+PROFILE_STAGE = os.environ.get("RETAIL_PROFILE")
+PROFILE_DIR = os.environ.get("RETAIL_PROFILE_DIR", os.path.join("data","cache","profiles"))
+# Most recent events of this process
+EVENTS = []
+MAX_EVENTS = 1000
+
+_local = threading.local()
+_lock = threading.Lock()
+
+def peak_rss_mb():
+    # Peak resident memory of the process so far, None when the platform doesn't tell
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return round(peak / (1024 * 1024 if sys.platform=="darwin" else 1024), 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / 1024**2, 1)
+    except ImportError:
+        return None
+
+def count_rows(obj):
+    # Rows of a DataFrame, or of each DataFrame of a dict
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return len(obj)
+    if isinstance(obj, dict) and obj and all(isinstance(v, (pd.DataFrame, pd.Series)) for v in obj.values()):
+        return {name: len(df) for name, df in obj.items()}
+    return None
+
+def emit(event):
+    with _lock:
+        EVENTS.append(event)
+        del EVENTS[:-MAX_EVENTS]
+        if EVENTS_PATH:
+            line = json.dumps(event, ensure_ascii=False, default=str)
+            if EVENTS_PATH == "-":
+                print(line, file=sys.stderr)
+            else:
+                with open(EVENTS_PATH, "a", encoding="utf8") as f:
+                    f.write(line + "\n")
+
+@contextmanager
+def stage(name, **fields):
+    """
+    Time a block and emit its event. The yielded dict takes extra fields, e.g.
+        with stage("density.merge", rows_in=len(df)) as event:
+            ...
+            event["rows_out"] = len(result)
+    """
+    stack = _local.__dict__.setdefault("stack", [])
+    event = {"stage": name, "parent": stack[-1]["stage"] if stack else None, **fields}
+    profiler = cProfile.Profile() if PROFILE_STAGE == name else None
+    stack.append(event)
+    peak_before = peak_rss_mb()
+    start = time.perf_counter()
+    event["start"] = datetime.now(timezone.utc).isoformat()
+    if profiler:
+        profiler.enable()
+    try:
+        yield event
+    except Exception as e:
+        event["error"] = repr(e)
+        raise
+    finally:
+        if profiler:
+            profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            event["profile"] = os.path.join(PROFILE_DIR, f"{name}-{time.time_ns()}.prof")
+            profiler.dump_stats(event["profile"])
+        stack.pop()
+        event["seconds"] = round(time.perf_counter() - start, 4)
+        event["process_peak_rss_mb"] = peak_rss_mb()
+        if peak_before is not None:
+            event["peak_rss_growth_mb"] = round(event["process_peak_rss_mb"] - peak_before, 1)
+        emit(event)
+
+def annotate(**fields):
+    # Add fields to the event of the innermost running stage, if any
+    stack = getattr(_local, "stack", None)
+    if stack:
+        stack[-1].update(fields)
+
+def match_rate(ids):
+    # Share of rows that got an ID
+    return round(float(ids.notna().mean()), 4) if len(ids) else None
+
+def instrumented(name=None):
+    """
+    Decorator emitting a stage event per call, with the rows of the first DataFrame argument (rows_in)
+    and of the result (rows_out).
+    """
+    def decorator(func):
+        stage_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            frames = [arg for arg in list(args) + list(kwargs.values()) if isinstance(arg, pd.DataFrame)]
+            with stage(stage_name, rows_in=len(frames[0]) if frames else None) as event:
+                result = func(*args, **kwargs)
+                event["rows_out"] = count_rows(result)
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,123 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+"""
+Minimal DAG runner for the data pipeline.
+Each step (an exec/transform function) is a node with declared inputs. A node is submitted to a process pool
+as soon as all its inputs are done, so independent loaders (boundaries, census workbooks, store files) run
+on all cores. Every result is computed once and handed to all the nodes that need it.
+Functions must be importable module-level functions (or functools.partial of them), to be sent to the workers.
+"""
+
+class Node:
+    def __init__(self, name, func, inputs=None, after=(), kwargs=None):
+        self.name = name
+        self.func = func
+        # {parameter name: node name}, the result of the node is passed as that keyword argument
+        self.inputs = dict(inputs or {})
+        # Nodes that must be done first without passing their result (e.g. they fill a cache)
+        self.after = tuple(after)
+        self.kwargs = dict(kwargs or {})
+
+    @property
+    def requires(self):
+        return set(self.inputs.values()) | set(self.after)
+
+def _run_node(func, kwargs):
+    # Runs in a worker: (result, start, end, pid)
+    start = time.time()
+    result = func(**kwargs)
+    return result, start, time.time(), os.getpid()
+
+class Pipeline:
+    def __init__(self):
+        self.nodes = {}
+        self.timings = {}
+
+    def add(self, name, func, inputs=None, after=(), **kwargs):
+        if name in self.nodes:
+            raise ValueError(f"Node {name} already exists")
+        self.nodes[name] = Node(name, func, inputs, after, kwargs)
+        return self
+
+    def _needed(self, targets):
+        # The targets and everything upstream of them
+        needed, stack = set(), list(targets)
+        while stack:
+            name = stack.pop()
+            if name not in self.nodes:
+                raise KeyError(f"Unknown node {name}")
+            if name not in needed:
+                needed.add(name)
+                stack.extend(self.nodes[name].requires)
+        return needed
+
+    def run(self, targets=None, workers=None):
+        """
+        Run the target nodes (all by default) and their dependencies, returning {node: result}.
+        workers=1 runs every node in this process, one after the other.
+        """
+        needed = self._needed(targets or list(self.nodes))
+        results, self.timings = {}, {}
+        self.started = time.time()
+        if workers == 1:
+            for name in self._order(needed):
+                node = self.nodes[name]
+                result, start, end, pid = _run_node(node.func, self._kwargs(node, results))
+                results[name] = result
+                self.timings[name] = (start, end, pid)
+            return {name: results[name] for name in (targets or needed)}
+
+        pending = set(needed)
+        running = {}
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            while pending or running:
+                for name in [name for name in pending if self.nodes[name].requires <= set(results)]:
+                    node = self.nodes[name]
+                    running[executor.submit(_run_node, node.func, self._kwargs(node, results))] = name
+                    pending.remove(name)
+                if not running:
+                    raise ValueError(f"Cyclic dependencies between {sorted(pending)}")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    result, start, end, pid = future.result()
+                    results[name] = result
+                    self.timings[name] = (start, end, pid)
+        return {name: results[name] for name in (targets or needed)}
+
+    def _kwargs(self, node, results):
+        return {**node.kwargs, **{param: results[dep] for param, dep in node.inputs.items()}}
+
+    def _order(self, needed):
+        # Topological order of the needed nodes
+        order, done = [], set()
+        while len(order) < len(needed):
+            ready = [name for name in needed - done if self.nodes[name].requires <= done]
+            if not ready:
+                raise ValueError(f"Cyclic dependencies between {sorted(needed - done)}")
+            order.extend(sorted(ready))
+            done.update(ready)
+        return order
+
+    def critical_path(self):
+        # Longest chain of dependent nodes by run time: (nodes, seconds)
+        longest = {}
+        for name in self._order(set(self.timings)):
+            start, end, _ = self.timings[name]
+            before = max(self.nodes[name].requires, key=lambda dep: longest[dep][1], default=None)
+            path, seconds = longest[before] if before else ([], 0.0)
+            longest[name] = (path + [name], seconds + end - start)
+        return max(longest.values(), key=lambda item: item[1], default=([], 0.0))
+
+    def report(self):
+        lines = [f"{'node':<24}{'start':>8}{'seconds':>9}  worker"]
+        for name, (start, end, pid) in sorted(self.timings.items(), key=lambda item: item[1][0]):
+            lines.append(f"{name:<24}{start - self.started:>8.2f}{end - start:>9.2f}  {pid}")
+        wall = max((end for _, end, _ in self.timings.values()), default=self.started) - self.started
+        total = sum(end - start for start, end, _ in self.timings.values())
+        path, seconds = self.critical_path()
+        lines.append(f"Wall time {wall:.2f}s for {total:.2f}s of work")
+        lines.append(f"Critical path ({seconds:.2f}s): {' -> '.join(path)}")
+        return "\n".join(lines)
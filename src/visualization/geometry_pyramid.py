@@ -0,0 +1,93 @@
+import os
+import hashlib
+import numpy as np
+import shapely
+from src.utils.artifact_cache import CACHE_DIR
+from src.data_quality.admin_keys import to_en
+
+"""
+Simplified geometries for choropleth rendering, at several resolutions ("pyramid").
+The full precision GADM/CityScope polygons make the map payload weigh many megabytes, while
+at city zoom a ward border only needs a few dozen vertices.
+- every level is simplified as a coverage, so that neighbouring wards keep exactly the same shared border
+- district and city shapes are dissolved from the wards, so that the 3 admin levels stay consistent
+- each (city, admin level, resolution) is cached as a compact GeoJSON file
+"""
+
+# Resolution -> simplification tolerance (degrees, 1e-4 ~ 11m)
+TOLERANCES = {"high": 0.0001, "medium": 0.0005, "low": 0.002}
+# Coordinates are rounded to ~1m
+PRECISION = 5
+PYRAMID_DIR = os.path.join(CACHE_DIR, "pyramid")
+# Properties kept for each admin level
+PROPERTIES = {"ward": ["ward_id","dist_id","city","district","ward","ward_org","district_org"],
+              "district": ["dist_id","city","district","district_org"],
+              "city": ["city","city_org"]}
+
+def resolution_for_zoom(zoom):
+    # Leaflet zoom level -> pyramid resolution
+    if zoom >= 14:
+        return "high"
+    return "medium" if zoom >= 11 else "low"
+
+def dissolve_levels(ward_boundaries):
+    # Ward -> district -> city shapes, all derived from the same ward polygons
+    wards = ward_boundaries[[col for col in PROPERTIES["ward"] if col in ward_boundaries.columns] + ["geometry"]]
+    wards = wards[~(wards.geometry.isna() | wards.geometry.is_empty)]
+    # Only the districts & cities of these wards, also when their columns are categoricals of every ID/name (compact)
+    districts = wards.dissolve(by=["dist_id"], as_index=False, observed=True)
+    cities = wards.dissolve(by="city", as_index=False, observed=True)
+    if "city_org" in ward_boundaries.columns:
+        cities["city_org"] = cities["city"].map(ward_boundaries.groupby("city")["city_org"].first())
+    return {"ward": wards,
+            "district": districts[[col for col in PROPERTIES["district"] if col in districts.columns] + ["geometry"]],
+            "city": cities[[col for col in PROPERTIES["city"] if col in cities.columns] + ["geometry"]]}
+
+def simplify(geometries, tolerance):
+    # Shared borders are simplified once for both neighbours, so no gap or overlap appears between them
+    geoms = np.asarray(geometries.values)
+    # Missing and empty geometries are kept as they are, coverage_simplify rejects them
+    valid = ~(shapely.is_missing(geoms) | shapely.is_empty(geoms))
+    simplified = geoms.copy()
+    try:
+        simplified[valid] = shapely.coverage_simplify(geoms[valid], tolerance)
+    except (AttributeError, TypeError, shapely.errors.GEOSException):
+        # shapely < 2.1, non-polygonal geometries or invalid coverage: simplify each geometry on its own
+        simplified[valid] = shapely.simplify(geoms[valid], tolerance, preserve_topology=True)
+    # Round coordinates, shared vertices stay shared
+    return shapely.transform(simplified, lambda coords: np.round(coords, PRECISION))
+
+def fingerprint(gdf):
+    return hashlib.sha256(b"".join(wkb or b"" for wkb in gdf.geometry.to_wkb().values) + "".join(gdf.columns).encode("utf8")).hexdigest()[:16]
+
+def _path(city, admin_level, resolution, key):
+    return os.path.join(PYRAMID_DIR, f"{to_en(city)}-{admin_level}-{resolution}-{key}.geojson")
+
+def build_pyramid(ward_boundaries, city):
+    # Build and save every admin level and resolution of a city
+    city_wards = ward_boundaries[ward_boundaries["city"]==city].to_crs(4326)
+    key = fingerprint(city_wards)
+    os.makedirs(PYRAMID_DIR, exist_ok=True)
+    # Remove the layers built from older boundaries
+    for name in os.listdir(PYRAMID_DIR):
+        if name.startswith(f"{to_en(city)}-") and not name.endswith(f"-{key}.geojson"):
+            os.remove(os.path.join(PYRAMID_DIR, name))
+    layers = {}
+    for admin_level, gdf in dissolve_levels(city_wards).items():
+        for resolution, tolerance in TOLERANCES.items():
+            layer = gdf.copy()
+            layer["geometry"] = simplify(gdf.geometry, tolerance)
+            geojson = layer.to_json(drop_id=True, separators=(",",":"))
+            with open(_path(city, admin_level, resolution, key), "w", encoding="utf8") as f:
+                f.write(geojson)
+            layers[(admin_level, resolution)] = geojson
+    return layers
+
+def get_layer(ward_boundaries, city, admin_level="ward", resolution="medium"):
+    # GeoJSON of a city at the given resolution (see resolution_for_zoom), built on first use
+    city_wards = ward_boundaries[ward_boundaries["city"]==city].to_crs(4326)
+    path = _path(city, admin_level, resolution, fingerprint(city_wards))
+    if os.path.exists(path):
+        with open(path, encoding="utf8") as f:
+            return f.read()
+    return build_pyramid(ward_boundaries, city)[(admin_level, resolution)]
@@ -0,0 +1,60 @@
+from functools import lru_cache
+import numpy as np
+from folium.plugins import FastMarkerCluster
+from src.data_analysis.ward_lookup import WardLookup
+
+"""
+Store markers for the dashboard map, clustered in the browser.
+- every store is located in its ward once, with one indexed point-in-polygon query for the whole store list
+- a selection (city, district, ward, concept) is then a vectorized filter on the ward positions of the stores
+- the payload of a selection is a compact [lat, long, popup] array per brand, cached per selection, and rendered
+  by FastMarkerCluster: one JavaScript loop builds the markers instead of one folium.Marker object per store
+"""
+
+# Coordinates are rounded to ~1m
+PRECISION = 5
+# Builds the marker of one [lat, long, popup] row in the browser
+MARKER_CALLBACK = """
+function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.bindPopup(row[2]);
+    return marker;
+}
+"""
+
+class StoreMarkers:
+    def __init__(self, stores, views, lookup=None, brand_col="brand", default_brand="Stores", popup_col="STORE_NAME",
+                 lat_col="lat", lon_col="long"):
+        """
+        - stores: one row per store with coordinates, a concept column is used to filter by concept
+        - views: CityViews of the boundary the stores are located in
+        - lookup: WardLookup of the same boundary, built here if not given
+        - brand_col: one map layer per brand, a single `default_brand` layer if stores have no such column
+        """
+        self.views = views
+        lookup = lookup or WardLookup(views.boundary)
+        located = stores.reset_index(drop=True)
+        located = located.assign(_position=lookup.locate_many(located[lon_col], located[lat_col]))
+        located = located[located["_position"] >= 0]
+        self.positions = located["_position"].to_numpy()
+        self.brands = located[brand_col].astype(str).to_numpy() if brand_col in located else np.full(len(located), default_brand)
+        self.concepts = located["concept"].astype(str).to_numpy() if "concept" in located else None
+        self.rows = np.column_stack([located[lat_col].to_numpy(dtype=float).round(PRECISION).astype(object),
+                                     located[lon_col].to_numpy(dtype=float).round(PRECISION).astype(object),
+                                     located[popup_col].fillna("").astype(str).to_numpy(dtype=object)]) \
+                    if len(located) else np.empty((0, 3), dtype=object)
+
+    @lru_cache(maxsize=64)
+    def payload(self, city, district="All", ward="All", concept="All"):
+        # {brand: [[lat, long, popup], ...]} of the stores of the selection ("All" for no filter)
+        wards = self.views.positions.get(self.views.selection_key(city, district, ward), [])
+        keep = np.isin(self.positions, wards)
+        if concept != "All" and self.concepts is not None:
+            keep &= self.concepts == str(concept)
+        return {brand: self.rows[keep & (self.brands == brand)].tolist() for brand in np.unique(self.brands[keep])}
+
+    def add_to(self, m, city, district="All", ward="All", concept="All"):
+        # One clustered layer per brand
+        for brand, rows in self.payload(city, district, ward, concept).items():
+            FastMarkerCluster(rows, callback=MARKER_CALLBACK, name=brand).add_to(m)
+        return m
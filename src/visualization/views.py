@@ -0,0 +1,43 @@
+from functools import lru_cache
+import pandas as pd
+
+"""
+Per-city views of the boundary table for the dashboard.
+Everything a selectbox needs (options, filtered wards, map center) is indexed once,
+so that a widget change costs dictionary lookups instead of scanning the national table.
+"""
+
+class CityViews:
+    def __init__(self, boundary, cities=None):
+        self.boundary = boundary.reset_index(drop=True)
+        self.cities = list(self.boundary["city"].unique())
+        # Selection -> positions of its wards
+        self.positions = {}
+        for keys in [["city"], ["city","district"], ["city","ward"], ["city","district","ward"]]:
+            for key, positions in self.boundary.groupby(keys, sort=False).indices.items():
+                self.positions[(tuple(keys), key if isinstance(key, tuple) else (key,))] = positions
+        self.district_options = {city: list(df["district"].unique()) for city, df in self.boundary.groupby("city", sort=False)}
+        self.ward_options = {city: list(df["ward"].unique()) for city, df in self.boundary.groupby("city", sort=False)}
+        # Map center of each city: its representative point from vn_boundaries.exec("city") if given,
+        # else the mean of its wards' centroids
+        if cities is None:
+            centroids = self.boundary.to_crs(epsg=4326).geometry.centroid
+            cities = pd.DataFrame({"city": self.boundary["city"], "lat": centroids.y, "long": centroids.x})
+        centers = cities.groupby("city")[["lat","long"]].mean()
+        self.centers = {city: [row.lat, row.long] for city, row in centers.iterrows()}
+
+    @staticmethod
+    def selection_key(city, district="All", ward="All"):
+        # Key of the selection in self.positions ("All" for no filter on a level)
+        keys, values = ["city"], [city]
+        if district != "All":
+            keys.append("district"); values.append(district)
+        if ward != "All":
+            keys.append("ward"); values.append(ward)
+        return tuple(keys), tuple(values)
+
+    @lru_cache(maxsize=64)
+    def filtered(self, city, district="All", ward="All"):
+        # Wards of the selection
+        positions = self.positions.get(self.selection_key(city, district, ward), [])
+        return self.boundary.iloc[positions]
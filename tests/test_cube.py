@@ -0,0 +1,68 @@
+import os
+import sys
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.data_analysis import cube
+from src.data_analysis.scoring import HOUSEHOLD_COLS
+
+"""
+The incremental refresh of the cube gives the same tables as a full rebuild from the same stores.
+"""
+
+WARDS = pd.DataFrame({"ward_id": ["w1","w2","w3"], "dist_id": ["d1","d1","d2"], "city": "C",
+                      "district": ["D1","D1","D2"], "ward": ["W1","W2","W3"], "area_sqm": [1e6, 2e6, 3e6]})
+DISTS = pd.DataFrame({"dist_id": ["d1","d2"], "city": "C", "district": ["D1","D2"], "area_sqm": [3e6, 3e6]})
+
+def demographic_ward():
+    df = WARDS[["ward_id"]].assign(total=[100, 200, 300], urban=[100, 150, 0], rural=[0, 50, 300])
+    for i, col in enumerate(HOUSEHOLD_COLS):
+        df[col] = [i, i + 1, i + 2]
+    return df
+
+def demographic_dist():
+    return pd.DataFrame({"dist_id": ["d1","d2"], "15-34_urban": [60, 0], "15-34_rural": [30, 90], "15-34_total": [90, 90]})
+
+def winmart(*rows):
+    return pd.DataFrame(list(rows), columns=["STORE_ID","concept","ward_id","dist_id"])
+
+def bhx(*rows):
+    return pd.DataFrame(list(rows), columns=["storeId","storeTypeId","ward_id","dist_id"])
+
+def refresh(cube_dir, stores_Winmart, stores_BHX, force=False):
+    return cube.refresh(WARDS, DISTS, demographic_ward(), demographic_dist(), stores_Winmart, stores_BHX,
+                        cube_dir=str(cube_dir), force=force)
+
+@pytest.fixture(autouse=True)
+def sources(tmp_path, monkeypatch):
+    # The demographic key is the hash of one fixed file instead of the census workbooks
+    source = tmp_path / "source.txt"
+    source.write_text("census")
+    monkeypatch.setattr(cube, "demographic_sources", lambda: [str(source)])
+
+def assert_same(incremental, full):
+    for name in cube.CUBE_NAMES:
+        assert set(incremental[name].columns) == set(full[name].columns)
+        pd.testing.assert_frame_equal(incremental[name][full[name].columns], full[name], check_dtype=False)
+
+def test_district_measures(tmp_path):
+    tables = refresh(tmp_path, winmart(["1","Mini","w1","d1"]), bhx(["10","1","w3","d2"]))
+    dist_cube = tables["dist_cube"].set_index("dist_id")
+    assert dist_cube.loc["d1","population"] == 300
+    assert dist_cube.loc["d2","urban"] == 0
+    assert dist_cube.loc["d1","households"] == tables["ward_cube"]["households"].iloc[:2].sum()
+    assert dist_cube.loc["d1","15-34_urban"] == 60
+    assert dist_cube.loc["d2","young"] == 90
+
+def test_incremental_after_removal(tmp_path):
+    refresh(tmp_path / "cube", winmart(["1","Premium","w1","d1"], ["2","Mini","w3","d2"]), bhx(["10","1","w2","d1"]))
+    # The only Premium store is removed and a BHX store moves to another district
+    stores = winmart(["2","Mini","w3","d2"]), bhx(["10","1","w3","d2"])
+    incremental = refresh(tmp_path / "cube", *stores)
+    full = refresh(tmp_path / "full", *stores, force=True)
+    assert "stores_Winmart_Premium" not in incremental["ward_cube"]
+    assert "stores_Winmart_Premium" not in incremental["dist_cube"]
+    assert_same(incremental, full)
+    assert incremental["dist_cube"].set_index("dist_id").loc["d2","stores_BHX"] == 1
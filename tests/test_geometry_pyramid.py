@@ -0,0 +1,52 @@
+import os
+import sys
+import json
+import geopandas as gpd
+import pytest
+import shapely
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.visualization import geometry_pyramid
+from src.utils.compact import IdLookup, compact
+
+"""
+Map layers of the geometry pyramid, from plain and compact boundaries.
+"""
+
+def boundary():
+    # 2 cities of 2 districts of 2 wards each, as a grid of unit squares
+    rows = []
+    for c, city in enumerate(["CityA","CityB"]):
+        for d in range(2):
+            for w in range(2):
+                x, y = c * 4 + d * 2 + w, 0
+                rows.append({"ward_id": f"w{c}{d}{w}", "dist_id": f"d{c}{d}", "city": city, "district": f"D{c}{d}",
+                             "ward": f"W{c}{d}{w}", "geometry": shapely.box(100 + x * 0.01, 10, 100 + (x + 1) * 0.01, 10.01)})
+    return gpd.GeoDataFrame(rows, crs=4326)
+
+@pytest.fixture(autouse=True)
+def pyramid_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(geometry_pyramid, "PYRAMID_DIR", str(tmp_path))
+
+@pytest.mark.parametrize("compacted", [False, True])
+def test_layers_of_one_city(compacted):
+    wards = boundary()
+    if compacted:
+        wards = compact(wards, {"ward_id": IdLookup.from_boundary(wards, "ward_id")})
+    for admin_level, expected in [("ward", 4), ("district", 2), ("city", 1)]:
+        layer = json.loads(geometry_pyramid.get_layer(wards, "CityA", admin_level, "high"))
+        assert len(layer["features"]) == expected
+        assert all(feature["geometry"]["coordinates"] for feature in layer["features"])
+
+def test_wards_without_geometry_are_left_out():
+    wards = boundary()
+    wards.loc[0, "geometry"] = None
+    wards.loc[1, "geometry"] = shapely.Polygon()
+    layer = json.loads(geometry_pyramid.get_layer(wards, "CityA", "district", "high"))
+    assert [feature["properties"]["dist_id"] for feature in layer["features"]] == ["d01"]
+
+def test_simplify_falls_back_on_non_polygonal_geometries():
+    geoms = gpd.GeoSeries([shapely.box(0, 0, 1, 1), shapely.GeometryCollection([shapely.box(1, 0, 2, 1), shapely.Point(3, 3)]), None])
+    simplified = geometry_pyramid.simplify(geoms, 0.01)
+    assert shapely.equals(simplified[0], geoms[0]) and simplified[2] is None
@@ -0,0 +1,31 @@
+import os
+import sys
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.data_analysis.key_matcher import KeyMatcher
+
+"""
+Fuzzy stage of the key matcher: a boundary is only accepted for one name.
+"""
+
+BOUNDARY = pd.DataFrame({"ward_id": ["w1","w2"], "dist_id": "d1", "city": "C", "district": "D", "ward": ["NguyenDu","BenThanh"],
+                         "dist_en": "d", "ward_en": ["nguyendu","benthanh"]})
+
+def census(*wards):
+    return pd.DataFrame({"city": "C", "district": "D", "district_org": "D", "dist_en": "d",
+                         "ward": list(wards), "ward_org": list(wards), "ward_en": [ward.lower() for ward in wards]})
+
+def test_fuzzy_accepts_a_boundary_once():
+    matcher = KeyMatcher(BOUNDARY)
+    matched = matcher.match(census("NguyenDuc", "NguyenDuu"), "ward")
+    assert matched.tolist().count("w1") == 1
+    assert matcher.hits["ward"]["fuzzy"] == 1
+    review = matcher.review["ward"]
+    assert (~review["accepted"]).sum() == 1
+
+def test_fuzzy_skips_boundaries_matched_exactly():
+    matcher = KeyMatcher(BOUNDARY)
+    matched = matcher.match(census("NguyenDu", "NguyenDuu"), "ward")
+    assert matched.iloc[0] == "w1" and pd.isna(matched.iloc[1])
@@ -0,0 +1,18 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.data_quality.store_locations import override_wards
+
+"""
+Ward name overrides of the Winmart stores.
+"""
+
+def test_overrides_only_stores_without_coordinates():
+    stores = pd.DataFrame({"STORE_ID": ["5549","5549","1"], "ward": ["P. Vĩnh Bảo"] * 3,
+                           "lat": [10.0, np.nan, np.nan], "long": [105.1, np.nan, np.nan]})
+    stores = override_wards(stores, lon_col="long", lat_col="lat")
+    assert stores["ward"].tolist() == ["P. Vĩnh Bảo", "VĩnhLạc", "P. Vĩnh Bảo"]
@@ -0,0 +1,38 @@
+import os
+import sys
+import geopandas as gpd
+import numpy as np
+import shapely
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.data_quality.vn_boundaries import DIST_COLS, build_hierarchy
+
+"""
+District and city shapes of build_hierarchy against a plain GeoDataFrame.dissolve of the wards.
+"""
+
+def wards():
+    # 2 cities: a grid of 3 districts of 4 wards, and a district split in 2 parts (multipolygon) with a ward with a hole
+    rows = []
+    for d in range(3):
+        for w in range(4):
+            x, y = 105 + d * 0.02 + (w % 2) * 0.01, 21 + (w // 2) * 0.01
+            rows.append(("HàNội", f"D{d}", f"w{d}{w}", shapely.box(x, y, x + 0.01, y + 0.01)))
+    rows.append(("HảiPhòng", "D3", "w30", shapely.box(106.5, 20.8, 106.52, 20.82).difference(shapely.box(106.505, 20.805, 106.51, 20.81))))
+    rows.append(("HảiPhòng", "D3", "w31", shapely.box(106.6, 20.8, 106.61, 20.81)))
+    df = gpd.GeoDataFrame([{"country": "VietNam", "city": city, "district": district, "dist_id": f"VNM.{city}.{district}",
+                            "city_org": city, "district_org": district, "dist_en": district.lower(), "ward": ward,
+                            "ward_id": f"VNM.{ward}", "geometry": geometry} for city, district, ward, geometry in rows], crs=4326)
+    return df
+
+def test_districts_and_cities_match_dissolve():
+    ward_boundaries, dist_boundaries, cities = build_hierarchy(wards())
+    expected = wards().dissolve(by=DIST_COLS, as_index=False).set_index("dist_id").loc[dist_boundaries["dist_id"]]
+    assert shapely.equals(dist_boundaries.geometry.values, expected.geometry.values).all()
+    assert np.allclose(dist_boundaries["area_sqm"], expected.to_crs(epsg=6933).area.to_numpy())
+    assert np.allclose(ward_boundaries["area_sqm"], wards().to_crs(epsg=6933).area.to_numpy())
+
+    expected_cities = wards().dissolve(by="city").loc[cities["city"]]
+    points = gpd.points_from_xy(cities["long"], cities["lat"])
+    assert shapely.within(points, expected_cities.geometry.values).all()
@@ -0,0 +1,40 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.data_quality.ward_crosswalk import parse_transfers, split_weights
+
+"""
+Parsing of the notes of the ward change record, and the split weights derived from them.
+"""
+
+@pytest.mark.parametrize("note, transfers", [
+    # Whole ward merged into another one
+    ("Nhập toàn bộ 5,67 km2 diện tích tự nhiên, 3.885 người của xã Bình Thới vào thị trấn Châu Ổ",
+     {"chauo": (5.67, 3885.0)}),
+    # Part of a ward moved to another one
+    ("Nhập 0,01 km2 diện tích tự nhiên, 642 người của phường Ngô Thì Nhậm vào phường Nguyễn Du",
+     {"nguyendu": (0.01, 642.0)}),
+    # Ward split between several wards, numbered wards keep their number only
+    ("Điều chỉnh 1,20 km2 diện tích tự nhiên, 1.500 người của xã An Bình vào xã Bình Minh và "
+     "0,80 km2 diện tích tự nhiên, 700 người của xã An Bình vào Phường 03",
+     {"binhminh": (1.2, 1500.0), "3": (0.8, 700.0)}),
+    # New ward without a target in the note, description of a ward in ha, no note: equal split
+    ("Thành lập xã Lâm Hợp trên cơ sở nhập toàn bộ 36,32 km2 diện tích tự nhiên, 4.905 người của xã Kỳ Lâm", {}),
+    ("Phường Vĩnh Phúc có 73,72 ha diện tích tự nhiên và 15.743 nhân khẩu.", {}),
+    (np.nan, {}),
+])
+def test_parse_transfers(note, transfers):
+    assert parse_transfers(note) == transfers
+
+def test_split_weights():
+    df = pd.DataFrame({"old": ["a","a","b","b","c","c"],
+                       "population": [300, 100, 50, np.nan, 0, 0]})
+    weights = split_weights(df, ["old"], "population")
+    assert weights.iloc[:2].tolist() == [0.75, 0.25]
+    # Unknown for part of the group, or nothing to split: no weight
+    assert weights.iloc[2:].isna().all()